@@ -1,5 +1,7 @@
 from django.contrib import admin
-from . models import Listing, Comment, User, Watchlist, Bid, Model, Brand, Category
+from . models import (
+    Listing, Comment, User, Watchlist, Bid, Model, Brand, Category, OutboxEvent, OutbidNotice, IdempotencyRecord,
+)
 
 admin.site.register(Category)
 admin.site.register(Brand)
@@ -9,5 +11,6 @@ admin.site.register(User)
 admin.site.register(Watchlist)
 admin.site.register(Bid)
 admin.site.register(Comment)
-
-
+admin.site.register(OutboxEvent)
+admin.site.register(OutbidNotice)
+admin.site.register(IdempotencyRecord)
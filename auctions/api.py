@@ -0,0 +1,208 @@
+"""
+JSON API, version 1: listing pages, listing detail and taxonomy, and placing bids.
+
+Every response carries a strong ETag, and a request whose If-None-Match still matches gets a 304 before any
+of the response is built:
+
+- listing detail: Listing.version, which bids, saves and comments bump, plus the taxonomy version for the
+  names. Checking it is one primary key lookup of a single column.
+- listing pages: a digest of the (id, version) pairs on the page. The page itself is one compact index range
+  scan; a 304 only skips building the JSON.
+- taxonomy: the taxonomy cache version, no query at all.
+
+Responses are marked no-cache so clients revalidate each time instead of guessing how long a price holds.
+
+A bid POSTed with an Idempotency-Key header first claims the key by committing a pending record under
+(user, key), then bids (outside any transaction of its own, so place_bid can retry a locked database) and
+finally stores the outcome in the record. A retry with the same key gets that outcome back instead of bidding
+again; a concurrent duplicate fails on the record's unique constraint before it bids and gets a 409 while the
+first one is still pending. A bid that raises releases its claim. Records expire after
+AUCTIONS_IDEMPOTENCY_TTL seconds, a claim left pending by a crashed process included;
+`manage.py prune_idempotency_records` deletes them.
+
+Bids are authenticated by the session like the rest of the site, so CSRF protection applies: clients send the
+csrftoken cookie, set by any page with a form such as /login, back in an X-CSRFToken header.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET, require_POST
+
+from . import taxonomy
+from .bids import submit_bid
+from .models import Comment, IdempotencyRecord, Listing
+from .pagination import keyset_page
+from .views import BidForm
+
+# Columns of a listing on the list pages, and the ones renamed or followed through a relation
+LISTING_FIELDS = ('id', 'name', 'bid_count', 'date', 'end_time', 'version')
+LISTING_ALIASES = {
+    'price': F('current_price'),
+    'image': F('url'),
+    'category_name': F('category__category'),
+    'brand_name': F('brand__brand'),
+    'model_name': F('model__model'),
+}
+# ... and the additional ones of the detail page. The leader's hidden proxy maximum is never exposed.
+DETAIL_FIELDS = ('description', 'starting_bid', 'active', 'final_price')
+DETAIL_ALIASES = {
+    'owner_username': F('owner__username'),
+    'leader_username': F('leading_bidder__username'),
+    'winner_username': F('winner__username'),
+}
+COMMENTS_PAGE_SIZE = 20
+
+
+def _etag(*parts):
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def _conditional(request, etag, build):
+    # 304 when the client's copy is current, otherwise the JSON from build(); both carry the ETag
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _page_number(request, name):
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise Http404(f"Invalid {name}.")
+
+
+@require_GET
+def listings(request):
+    queryset = Listing.objects.filter(active=True)
+    for kind in taxonomy.KINDS:
+        name = request.GET.get(kind)
+        if name:
+            item = taxonomy.lookup(kind, name)
+            if item is None:
+                raise Http404(f"{kind.capitalize()} not found.")
+            queryset = queryset.filter(**{f'{kind}_id': item.id})
+    page = keyset_page(queryset.values(*LISTING_FIELDS, **LISTING_ALIASES), request.GET.get('after'))
+    digest = hashlib.md5(','.join(f"{item['id']}:{item['version']}" for item in page).encode()).hexdigest()
+    etag = _etag('listings', taxonomy.version(), digest, page.next_cursor or '')
+    return _conditional(request, etag, lambda: {'listings': page.items, 'next': page.next_cursor})
+
+
+@require_GET
+def listing(request, listing_id):
+    try:
+        version = Listing.objects.values_list('version', flat=True).get(id=listing_id)
+    except Listing.DoesNotExist:
+        raise Http404("Listing not found.")
+
+    def build():
+        data = Listing.objects.values(*LISTING_FIELDS, *DETAIL_FIELDS, **LISTING_ALIASES, **DETAIL_ALIASES) \
+            .get(id=listing_id)
+        comments = Comment.objects.filter(listing_comment=listing_id).order_by('id')
+        after = _page_number(request, 'comments_after')
+        if after is not None:
+            comments = comments.filter(id__gt=after)
+        page = list(comments.values('id', 'comment', 'date', user=F('user_comment__username'))
+                    [:COMMENTS_PAGE_SIZE + 1])
+        data['comments'] = page[:COMMENTS_PAGE_SIZE]
+        data['comments_next'] = page[COMMENTS_PAGE_SIZE - 1]['id'] if len(page) > COMMENTS_PAGE_SIZE else None
+        return data
+
+    return _conditional(request, _etag('listing', listing_id, version, taxonomy.version()), build)
+
+
+@require_GET
+def taxonomy_items(request):
+    def build():
+        return {kind: [{'id': item.id, 'name': getattr(item, field)} for item in taxonomy.all_items(kind)]
+                for kind, (model, field) in taxonomy.KINDS.items()}
+
+    return _conditional(request, _etag('taxonomy', taxonomy.version()), build)
+
+
+def idempotency_ttl():
+    return timedelta(seconds=getattr(settings, 'AUCTIONS_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def _replay(user, key, fingerprint):
+    record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+    if record is None:
+        return None
+    if record.created < timezone.now() - idempotency_ttl():
+        record.delete()
+        return None
+    if record.fingerprint != fingerprint:
+        return JsonResponse({'error': "Idempotency-Key was already used for a different request."}, status=422)
+    if record.response is None:
+        return JsonResponse({'error': "A request with this Idempotency-Key is still in progress."}, status=409)
+    response = JsonResponse(record.response)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _place(listing_id, user, amount, proxy):
+    try:
+        listing = Listing.objects.only('id', 'hot').get(id=listing_id)
+    except Listing.DoesNotExist:
+        raise Http404("Listing not found.")
+    result = submit_bid(listing, user, amount, proxy)
+    return {'status': result.status, 'price': result.price, 'bid_count': result.bid_count}
+
+
+@require_POST
+def bid(request, listing_id):
+    """
+    Place a bid from a JSON body {"amount": 12, "proxy": false}; returns its status, price and bid count.
+    Needs a logged-in session and the X-CSRFToken header.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return JsonResponse({'error': "Expected a JSON object."}, status=400)
+    # The same validation as the form of the listing page
+    form = BidForm({'bid_form': body.get('amount'), 'proxy': body.get('proxy', False)})
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    amount, proxy = form.cleaned_data['bid_form'], form.cleaned_data['proxy']
+
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return JsonResponse(_place(listing_id, request.user, amount, proxy))
+    if not key or len(key) > IdempotencyRecord._meta.get_field('key').max_length:
+        return JsonResponse({'error': "Invalid Idempotency-Key."}, status=400)
+    fingerprint = hashlib.sha256(f"{listing_id}:{amount}:{proxy}".encode()).hexdigest()
+    replayed = _replay(request.user, key, fingerprint)
+    if replayed is not None:
+        return replayed
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(user=request.user, key=key, fingerprint=fingerprint)
+    except IntegrityError:
+        # A concurrent request claimed the same key first and bids instead of this one
+        replayed = _replay(request.user, key, fingerprint)
+        if replayed is None:
+            raise
+        return replayed
+    try:
+        data = _place(listing_id, request.user, amount, proxy)
+    except Exception:
+        record.delete()
+        raise
+    IdempotencyRecord.objects.filter(id=record.id).update(response=data)
+    return JsonResponse(data)
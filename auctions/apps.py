@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from . import connections, search, signals  # noqa: F401
+        post_migrate.connect(search.reinstall_triggers, sender=self)
@@ -0,0 +1,191 @@
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import notifications, pagecache, pubsub
+from .models import Bid, Listing
+from .proxy import resolve
+
+ACCEPTED = 'accepted'
+TOO_LOW = 'too_low'
+OWN_LISTING = 'own_listing'
+CLOSED = 'closed'
+# A hidden maximum of the leader covered the bid
+OUTBID = 'outbid'
+
+BID_MESSAGES = {
+    ACCEPTED: "You made a successful bid for {amount} € !",
+    TOO_LOW: "Bid can't be less than current max bid",
+    OWN_LISTING: "You cannot bid on your own listing.",
+    CLOSED: "This auction has already ended.",
+    OUTBID: "Another bidder's maximum covers your bid of {amount} €, the price is now {price} €.",
+}
+PROXY_ACCEPTED_MESSAGE = "You lead at {price} €, we bid for you up to {amount} € !"
+
+
+# status is one of the constants above, price/bid_count/leader_id are the listing state after the attempt
+BidResult = namedtuple('BidResult', ['status', 'amount', 'price', 'bid_count', 'leader_id', 'bid'])
+
+
+def _retry_policy():
+    return (getattr(settings, 'AUCTIONS_BID_RETRIES', 5),
+            getattr(settings, 'AUCTIONS_BID_RETRY_BACKOFF', 0.01))
+
+
+def submit_bid(listing, user, amount, proxy=False):
+    # Entry point for the views: hot listings go through the in-memory engine when it is enabled,
+    # everything else straight to the database.
+    engine = _hot_engine(listing)
+    if engine is not None:
+        return engine.submit(listing.id, user, amount, proxy)
+    return place_bid(listing.id, user, amount, proxy)
+
+
+def apply_live_state(listing):
+    # The Listing row of a hot listing lags behind its in-memory book by up to one flush interval.
+    engine = _hot_engine(listing)
+    book = engine.peek(listing.id) if engine is not None else None
+    if book is not None:
+        listing.current_price = book.price
+        listing.bid_count = book.bid_count
+        listing.leading_bidder_id = book.leader_id
+        listing.proxy_maximum = book.maximum
+    return listing
+
+
+def release_hot_listing(listing):
+    # Stop the engine taking bids for a listing that is about to close, and write its bids through.
+    engine = _hot_engine(listing)
+    if engine is not None:
+        engine.close(listing.id)
+        listing.refresh_from_db()
+
+
+def _hot_engine(listing):
+    if not listing.hot:
+        return None
+    from .hot import get_engine
+    return get_engine()
+
+
+def place_bid(listing_id, user, amount, proxy=False):
+    # Accept or reject a bid with a compare-and-set UPDATE, so there is no window between reading the max bid
+    # and inserting like in a read-compare-insert. With proxy=True `amount` is a hidden maximum to bid up to
+    # (see auctions.proxy). Lock errors (SQLite's "database is locked") are retried a bounded number of times
+    # with backoff.
+    retries, backoff = _retry_policy()
+    attempt = 0
+    while True:
+        try:
+            with transaction.atomic():
+                result = None if proxy else _raise_price(listing_id, user, amount)
+                if result is None:
+                    result = _resolve_bid(listing_id, user, amount, proxy)
+            if result is not None:
+                return result
+            # A concurrent bid changed the state the bid was resolved against; resolve it again
+        except OperationalError:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+            attempt += 1
+
+
+def _raise_price(listing_id, user, amount):
+    # The common case, a plain bid with no hidden maximum in play, is one conditional UPDATE with nothing read
+    # before it: the database only lets one of several concurrent bidders move the price past a given value,
+    # and no read can go stale in between (on SQLite that would fail the lock upgrade and retry).
+    accepted = Listing.objects.filter(
+        Q(end_time__isnull=True) | Q(end_time__gt=timezone.now()),
+        id=listing_id, active=True, current_price__lt=amount, proxy_maximum__isnull=True,
+    ).exclude(owner=user).update(
+        current_price=amount,
+        bid_count=F('bid_count') + 1,
+        leading_bidder=user,
+        version=F('version') + 1,
+    )
+    if not accepted:
+        return None
+    # Accepted bids strictly increase, so the next lower bid is the one that led until now
+    previous = Bid.objects.filter(item_bid_id=listing_id, bid__lt=amount).order_by('-bid') \
+        .values_list('user_bid_id', flat=True).first()
+    if previous is not None and previous != user.id:
+        notifications.record_outbid(listing_id, previous, amount)
+    bid = Bid.objects.create(user_bid=user, item_bid_id=listing_id, bid=amount)
+    state = Listing.objects.values('bid_count', 'category_id', 'brand_id', 'model_id').get(id=listing_id)
+    pagecache.purge_listing(listing_id, state['category_id'], state['brand_id'], state['model_id'])
+    pubsub.publish_bid(listing_id, amount, state['bid_count'], user.get_username())
+    return BidResult(ACCEPTED, amount, amount, state['bid_count'], user.id, bid)
+
+
+def _resolve_bid(listing_id, user, amount, proxy):
+    # Read the price, leader and the leader's hidden maximum, resolve the bid against them and write the outcome
+    # with an UPDATE on exactly the state that was read. None when a concurrent bid got there first.
+    state = Listing.objects.values(
+        'current_price', 'bid_count', 'leading_bidder_id', 'leading_bidder__username', 'proxy_maximum', 'active',
+        'end_time', 'owner_id', 'category_id', 'brand_id', 'model_id').get(id=listing_id)
+    if not state['active'] or (state['end_time'] is not None and state['end_time'] <= timezone.now()):
+        return _rejected(CLOSED, amount, state)
+    if state['owner_id'] == user.id:
+        return _rejected(OWN_LISTING, amount, state)
+    resolution = resolve(state['current_price'], state['leading_bidder_id'], state['proxy_maximum'], user.id,
+                         amount, proxy=proxy)
+    if resolution is None:
+        return _rejected(TOO_LOW, amount, state)
+    updated = Listing.objects.filter(
+        Q(end_time__isnull=True) | Q(end_time__gt=timezone.now()),
+        id=listing_id, active=True, current_price=state['current_price'],
+        leading_bidder=state['leading_bidder_id'], proxy_maximum=state['proxy_maximum'],
+    ).update(
+        current_price=resolution.price,
+        bid_count=F('bid_count') + len(resolution.bids),
+        leading_bidder=resolution.leader_id,
+        proxy_maximum=resolution.maximum,
+        version=F('version') + 1,
+    )
+    if not updated:
+        return None
+    bids = Bid.objects.bulk_create([Bid(user_bid_id=user_id, item_bid_id=listing_id, bid=bid_amount)
+                                    for user_id, bid_amount in resolution.bids])
+    if resolution.outbid is not None and resolution.outbid != user.id:
+        notifications.record_outbid(listing_id, resolution.outbid, resolution.price)
+    bid_count = state['bid_count'] + len(bids)
+    if bids:
+        leader = user.get_username() if resolution.leader_id == user.id else state['leading_bidder__username']
+        pagecache.purge_listing(listing_id, state['category_id'], state['brand_id'], state['model_id'])
+        pubsub.publish_bid(listing_id, resolution.price, bid_count, leader)
+    own = [bid for bid in bids if bid.user_bid_id == user.id]
+    return BidResult(ACCEPTED if resolution.leader_id == user.id else OUTBID, amount, resolution.price, bid_count,
+                     resolution.leader_id, own[-1] if own else None)
+
+
+def _rejected(status, amount, state):
+    return BidResult(status, amount, state['current_price'], state['bid_count'], state['leading_bidder_id'], None)
+
+
+def bid_message(result, proxy=False):
+    if proxy and result.status == ACCEPTED:
+        return PROXY_ACCEPTED_MESSAGE.format(amount=result.amount, price=result.price)
+    return BID_MESSAGES[result.status].format(amount=result.amount, price=result.price)
+
+
+def rebuild_bid_stats(listings=None):
+    # Recompute current_price, bid_count and leading_bidder from the Bid table with a single UPDATE.
+    # Ties on the highest bid go to the earliest bid, the one that was accepted first.
+    if listings is None:
+        listings = Listing.objects.all()
+    bids = Bid.objects.filter(item_bid=OuterRef('pk'))
+    top_bid = bids.order_by('-bid', 'id')
+    bid_count = bids.order_by().values('item_bid').annotate(count=Count('id')).values('count')
+    return listings.update(
+        bid_count=Coalesce(Subquery(bid_count), 0),
+        current_price=Coalesce(Subquery(top_bid.values('bid')[:1]), F('starting_bid')),
+        leading_bidder=Subquery(top_bid.values('user_bid')[:1]),
+        version=F('version') + 1,
+    )
@@ -0,0 +1,50 @@
+# Maximum number of SQL queries each view may run, keyed by URL name.
+#
+# Counts assume a warm taxonomy cache and include the session and user lookups of a logged-in request,
+# and the SAVEPOINT/RELEASE pair that wraps a transaction inside the test suite. None of them depend on
+# how many listings, bids, comments or watchlist rows a page renders: every relation a template touches
+# is loaded up front with select_related, so adding rows must never change these numbers
+# (see QueryBudgetTests).
+QUERY_BUDGETS = {
+    # session, user, one page of listings with their taxonomy (the badges come from the taxonomy cache)
+    'index': 3,
+    # session, user, one page of listings (the name is resolved by the taxonomy cache)
+    'category': 3,
+    'brand': 3,
+    'model': 3,
+    # GET: session, user, listing with owner/winner/category, watchlist check, comments with authors
+    # POST: + savepoint, compare-and-set UPDATE, previous leader, outbid notice INSERT, Bid INSERT, listing
+    # state, release (a bid against a hidden maximum reads the state first and needs no previous leader)
+    'active_listing': 12,
+    # session, user, DELETE or DELETE + INSERT on POST, watchlist with listings
+    'watchlist': 5,
+    # session, user, won listings with their taxonomy
+    'purchase_history': 3,
+    # GET: session, user (the options come from the taxonomy cache). POST: session, user, INSERT
+    'create_listing': 3,
+    # session, user, listing row, savepoint, settling UPDATE, outbox INSERT, release
+    'close_bid': 7,
+    # session, user, INSERT, listing version UPDATE
+    'comment': 4,
+    # session, user, one keyset page, facet counts on a cache miss (three GROUP BYs, price buckets)
+    'browse': 7,
+    # session, user, FTS match (skipped on a search cache hit), cards; taxonomy from the cache
+    'search': 4,
+    # session, user; the rows are streamed after the response leaves the middleware
+    'export': 2,
+    # The API reads no session: one page of listings (the taxonomy names are joined, the filters come from the cache)
+    'api_listings': 1,
+    # version, then on a miss the listing with its users and taxonomy and one page of comments
+    'api_listing': 3,
+    # all from the taxonomy cache
+    'api_taxonomy': 0,
+    # session, user, idempotency record, savepoint, claim INSERT, release, listing, the bid as on active_listing
+    # (savepoint, UPDATE, previous leader, outbid notice INSERT, Bid INSERT, listing state, release), record UPDATE
+    'api_bid': 15,
+    # POST: user by username, last_login UPDATE, new session (key check, INSERT, savepoints), old session DELETE
+    'login': 9,
+    # session, user, session DELETE, flushed session
+    'logout': 4,
+    # POST: user INSERT in a savepoint, then the same session work as login
+    'register': 10,
+}
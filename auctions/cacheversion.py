@@ -0,0 +1,29 @@
+"""
+Version counters kept in the Django cache, used to invalidate families of cache entries at once.
+
+A counter starts from the clock rather than 1, so a counter lost to eviction or a cache restart never
+comes back with a value that older entries were stored under.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
@@ -0,0 +1,38 @@
+"""
+Per-connection database setup.
+
+SQLite keeps most of its tuning per connection, so the SQLITE_PRAGMAS setting is applied to each one as it
+opens; with CONN_MAX_AGE that is once per worker thread rather than once per request. The pragmas run on the
+raw sqlite3 connection so they stay out of the query counts of auctions.middleware.
+
+CONN_HEALTH_CHECKS only exists from Django 4.1 on. Before that, a persistent connection the database server
+dropped would fail the next request that used it, so each request starts by pinging the open connections of
+the aliases that ask for health checks and closes the ones that do not answer; they reconnect on first use.
+"""
+import django
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def close_unusable(wrappers):
+    for wrapper in wrappers:
+        if wrapper.settings_dict.get('CONN_HEALTH_CHECKS') and wrapper.connection is not None \
+                and not wrapper.in_atomic_block and not wrapper.is_usable():
+            wrapper.close()
+
+
+if django.VERSION < (4, 1):
+    @receiver(request_started)
+    def check_connections(sender, **kwargs):
+        close_unusable(connections.all())
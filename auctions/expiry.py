@@ -0,0 +1,31 @@
+"""
+Closing listings when their end_time passes.
+
+A close is one set-based settlement per batch (see auctions/settlement.py): the listings stop being active and
+their leading bidder, already kept on the row by auctions.bids, becomes the winner. A bid racing the close
+either commits before the UPDATE and wins, or finds the listing inactive. Bids are refused from end_time on
+anyway, so a late worker only delays the listing leaving the list pages, never changes who wins.
+"""
+from django.utils import timezone
+
+from .models import Listing
+from .settlement import settle
+
+
+def close_expired(now=None, batch_size=500):
+    """Close every listing whose end_time has passed, batch_size per settlement; returns how many were closed."""
+    if now is None:
+        now = timezone.now()
+    total = 0
+    while True:
+        ids = list(Listing.objects.filter(active=True, end_time__lte=now).order_by('end_time')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += settle(Listing.objects.filter(id__in=ids))
+
+
+def upcoming(until):
+    """(end_time, id) of the active listings ending before `until`, soonest first."""
+    return list(Listing.objects.filter(active=True, end_time__lte=until).order_by('end_time')
+                .values_list('end_time', 'id'))
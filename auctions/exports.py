@@ -0,0 +1,116 @@
+"""
+Streaming CSV and NDJSON exports of listings, bids and settled auctions for reconciliation.
+
+Rows are read with .iterator(chunk_size=...) and written out one at a time, so memory stays flat however many
+rows there are. Every export is ordered by id; pass the last id received as `after` to resume an interrupted
+export. Bids have no timestamp, so the date range of the bids export applies to the date of their listing.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Listing, Bid
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def listings_queryset():
+    return Listing.objects.values(
+        'id', 'name', 'date', 'active', 'starting_bid', 'current_price', 'bid_count',
+        category_name=F('category__category'), brand_name=F('brand__brand'), model_name=F('model__model'),
+        owner_username=F('owner__username'), leader_username=F('leading_bidder__username'),
+        winner_username=F('winner__username'),
+    )
+
+
+def bids_queryset():
+    return Bid.objects.values(
+        'id', 'bid', listing_id=F('item_bid_id'), listing_name=F('item_bid__name'),
+        bidder_username=F('user_bid__username'),
+    )
+
+
+def winners_queryset():
+    return Listing.objects.filter(active=False, winner__isnull=False).values(
+        'id', 'name', 'date', 'final_price', winner_username=F('winner__username'),
+        owner_username=F('owner__username'), category_name=F('category__category'),
+    )
+
+
+# kind -> (queryset factory, lookup prefix of the listing the filters apply to)
+EXPORTS = {
+    'listings': (listings_queryset, ''),
+    'bids': (bids_queryset, 'item_bid__'),
+    'winners': (winners_queryset, ''),
+}
+
+
+def parse_date(value, end=False):
+    # Accepts a date or a datetime; a bare end date includes the whole day
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD.")
+    if end and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_active(value):
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid active {value!r}, expected true or false.")
+
+
+def export_queryset(kind, since=None, until=None, category=None, active=None, after=None):
+    """Rows of one export as a values() queryset ordered by id; raises ValueError for bad filters."""
+    factory, prefix = EXPORTS[kind]
+    queryset = factory()
+    if since:
+        queryset = queryset.filter(**{f'{prefix}date__gte': parse_date(since)})
+    if until:
+        queryset = queryset.filter(**{f'{prefix}date__lte': parse_date(until, end=True)})
+    if category:
+        queryset = queryset.filter(**{f'{prefix}category__category': category})
+    if active not in (None, ''):
+        queryset = queryset.filter(**{f'{prefix}active': parse_active(active)})
+    if after not in (None, ''):
+        try:
+            queryset = queryset.filter(id__gt=int(after))
+        except ValueError:
+            raise ValueError(f"Invalid after {after!r}, expected a row id.")
+    return queryset.order_by('id')
+
+
+class Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_rows(queryset, fmt, chunk_size=None):
+    """Yield the queryset as CSV lines (with a header) or NDJSON lines."""
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'AUCTIONS_EXPORT_CHUNK_SIZE', 2000)
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        columns = [*queryset.query.values_select, *queryset.query.annotation_select]
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_value(row[column]) for column in columns])
+    else:
+        for row in rows:
+            yield json.dumps({key: _value(value) for key, value in row.items()}) + '\n'
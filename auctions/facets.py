@@ -0,0 +1,158 @@
+"""
+Filters and facet counts of the browse page.
+
+Every facet is counted with one GROUP BY over the listings matching all the *other* filters, so the counts
+show what picking a value would return and selected values can still be switched. That is one query per
+dimension (category, brand, model, plus one for the price buckets) whatever the number of badges.
+
+Counts are cached per filter combination under a version that listing and taxonomy saves bump
+(see auctions/signals.py). Bids move prices without a save, so the price counts can lag by up to
+AUCTIONS_FACET_CACHE_TIMEOUT seconds.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.http import Http404
+from django.utils.http import urlencode
+
+from . import taxonomy
+from .cacheversion import bump_version, get_version
+from .models import Listing
+
+VERSION_KEY = 'facets:version'
+TAXONOMY_FACETS = ('category', 'brand', 'model')
+# (label, lowest, highest) on current_price; highest is exclusive and None is open-ended
+PRICE_BUCKETS = [
+    ('under 100', None, 100),
+    ('100 - 499', 100, 500),
+    ('500 - 999', 500, 1000),
+    ('1000 - 4999', 1000, 5000),
+    ('5000 and more', 5000, None),
+]
+ACTIVE_CHOICES = ('true', 'false', 'all')
+
+
+def invalidate():
+    bump_version(VERSION_KEY)
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise Http404(f"Invalid {name}.")
+
+
+def parse_filters(params):
+    """The filters of a browse request: taxonomy names, min_price, max_price (inclusive) and active."""
+    filters = {}
+    for kind in TAXONOMY_FACETS:
+        name = params.get(kind)
+        if name:
+            if taxonomy.lookup(kind, name) is None:
+                raise Http404(f"{kind.capitalize()} not found.")
+            filters[kind] = name
+    for name in ('min_price', 'max_price'):
+        value = _int_param(params, name)
+        if value is not None:
+            filters[name] = value
+    active = params.get('active') or 'true'
+    if active not in ACTIVE_CHOICES:
+        raise Http404("Invalid active.")
+    filters['active'] = active
+    return filters
+
+
+def filter_q(filters, exclude=None):
+    # All filters but `exclude`, as one Q on Listing
+    q = Q()
+    for kind in TAXONOMY_FACETS:
+        if kind in filters and kind != exclude:
+            q &= Q(**{f'{kind}_id': taxonomy.lookup(kind, filters[kind]).id})
+    if exclude != 'price':
+        if 'min_price' in filters:
+            q &= Q(current_price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            q &= Q(current_price__lte=filters['max_price'])
+    if filters['active'] != 'all':
+        q &= Q(active=filters['active'] == 'true')
+    return q
+
+
+def _bucket_q(lowest, highest):
+    q = Q()
+    if lowest is not None:
+        q &= Q(current_price__gte=lowest)
+    if highest is not None:
+        q &= Q(current_price__lt=highest)
+    return q
+
+
+def compute_counts(filters):
+    counts = {}
+    for kind in TAXONOMY_FACETS:
+        rows = Listing.objects.filter(filter_q(filters, exclude=kind)).exclude(**{f'{kind}_id': None}) \
+            .values_list(f'{kind}_id').annotate(count=Count('id')).order_by()
+        counts[kind] = dict(rows)
+    # All price buckets in one pass with conditional counts
+    prices = Listing.objects.filter(filter_q(filters, exclude='price')).aggregate(**{
+        f'bucket{i}': Count('id', filter=_bucket_q(lowest, highest))
+        for i, (label, lowest, highest) in enumerate(PRICE_BUCKETS)
+    })
+    counts['price'] = [prices[f'bucket{i}'] for i in range(len(PRICE_BUCKETS))]
+    return counts
+
+
+def facet_counts(filters):
+    """{'category': {id: count}, 'brand': ..., 'model': ..., 'price': [count per PRICE_BUCKETS entry]}"""
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    key = f'facets:{get_version(VERSION_KEY)}:{taxonomy.version()}:{digest}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute_counts(filters)
+        cache.set(key, counts, getattr(settings, 'AUCTIONS_FACET_CACHE_TIMEOUT', 60))
+    return counts
+
+
+def filter_query(filters, **changes):
+    """Query string of the filters with `changes` applied; None removes a filter."""
+    params = {**filters, **changes}
+    if params.get('active') == 'true':
+        del params['active']
+    return urlencode({key: value for key, value in params.items() if value is not None})
+
+
+def facet_groups(filters, counts):
+    """Facets as the browse template shows them: a label, count, selected flag and toggle link per value."""
+    groups = [{'name': 'Show', 'items': [
+        {'label': label, 'count': None, 'selected': filters['active'] == value,
+         'query': filter_query(filters, active=value)}
+        for label, value in (('active', 'true'), ('closed', 'false'), ('all', 'all'))
+    ]}]
+    for kind in TAXONOMY_FACETS:
+        model, field = taxonomy.KINDS[kind]
+        items = []
+        for item in taxonomy.all_items(kind):
+            name = getattr(item, field)
+            selected = filters.get(kind) == name
+            count = counts[kind].get(item.id, 0)
+            if count or selected:
+                items.append({'label': name, 'count': count, 'selected': selected,
+                              'query': filter_query(filters, **{kind: None if selected else name})})
+        groups.append({'name': kind.capitalize(), 'items': items})
+    items = []
+    for (label, lowest, highest), count in zip(PRICE_BUCKETS, counts['price']):
+        highest = highest - 1 if highest is not None else None
+        selected = filters.get('min_price') == lowest and filters.get('max_price') == highest
+        if count or selected:
+            query = filter_query(filters, min_price=None, max_price=None) if selected \
+                else filter_query(filters, min_price=lowest, max_price=highest)
+            items.append({'label': label, 'count': count, 'selected': selected, 'query': query})
+    groups.append({'name': 'Price', 'items': items})
+    return groups
@@ -0,0 +1,266 @@
+"""
+In-process order books for the few listings that take most of the bids near the end of an auction.
+
+Bids on a hot listing are serialized through one worker thread per listing and decided against an in-memory
+book (price, leader and the accepted bids as compact arrays), so accepting a bid costs no database round trip.
+Accepted bids are written behind in batches with bulk_create together with the denormalized Listing columns.
+A book is rebuilt from the Bid table the first time a process sees the listing, which is also the recovery
+path after a crash; bids accepted within the last flush interval before a crash are lost. A listing that takes
+no bids for AUCTIONS_HOT_IDLE_TIMEOUT seconds, closed ones included, gives up its thread and book once they
+are flushed, and the next bid loads it again.
+
+The book is only authoritative inside one process, so a hot listing must be routed to a single worker process
+and take all its bids through auctions.bids.submit_bid. Enable with AUCTIONS_HOT_ENGINE = True and mark
+listings with Listing.hot.
+"""
+import atexit
+import logging
+import queue
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import pagecache, pubsub
+from .bids import ACCEPTED, CLOSED, OUTBID, OWN_LISTING, TOO_LOW, BidResult
+from .models import Listing, Bid, OutbidNotice
+from .proxy import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBook:
+    __slots__ = ('listing_id', 'owner_id', 'active', 'end_time', 'price', 'leader_id', 'leader_name', 'maximum',
+                 'amounts', 'bidders', 'flushed', 'outbids', 'taxonomy_ids', 'snapshot')
+
+    def __init__(self, listing_id, owner_id, active, price, taxonomy_ids=(), end_time=None):
+        self.listing_id = listing_id
+        # (category_id, brand_id, model_id), for purging the pages that show the listing
+        self.taxonomy_ids = taxonomy_ids
+        self.owner_id = owner_id
+        self.active = active
+        self.end_time = end_time
+        self.price = price
+        self.leader_id = None
+        self.leader_name = ''
+        # The leader's hidden proxy maximum, see auctions.proxy
+        self.maximum = None
+        self.amounts = array('q')
+        self.bidders = array('q')
+        # amounts[:flushed] are already stored in the Bid table
+        self.flushed = 0
+        # (bid_count, user_id, amount) of every bidder a bid displaced, until flushed as OutbidNotice rows
+        self.outbids = deque()
+        # (bid_count, maximum) after the last accepted bid, taken together for the flusher
+        self.snapshot = (0, None)
+
+    @property
+    def bid_count(self):
+        return len(self.amounts)
+
+    def bid(self, user_id, amount, proxy=False, username=''):
+        resolution = None
+        if not self.active or (self.end_time is not None and self.end_time <= timezone.now()):
+            status = CLOSED
+        elif user_id == self.owner_id:
+            status = OWN_LISTING
+        else:
+            resolution = resolve(self.price, self.leader_id, self.maximum, user_id, amount, proxy=proxy)
+            status = TOO_LOW
+        if resolution is not None:
+            for bidder, bid_amount in resolution.bids:
+                self.bidders.append(bidder)
+                self.amounts.append(bid_amount)
+            self.price = resolution.price
+            self.maximum = resolution.maximum
+            if resolution.leader_id != self.leader_id:
+                self.leader_id = resolution.leader_id
+                self.leader_name = username
+            if resolution.outbid is not None and resolution.outbid != user_id:
+                # Appended after the bids, so the flush sees them first
+                self.outbids.append((self.bid_count, resolution.outbid, resolution.price))
+            status = ACCEPTED if resolution.leader_id == user_id else OUTBID
+        return BidResult(status, amount, self.price, self.bid_count, self.leader_id, None)
+
+
+def load_book(listing_id):
+    # Rebuild a book from the Bid table; the highest bid wins, ties go to the earliest one.
+    listing = Listing.objects.values('owner_id', 'active', 'end_time', 'starting_bid', 'category_id', 'brand_id',
+                                     'model_id', 'proxy_maximum', 'leading_bidder__username').get(id=listing_id)
+    book = OrderBook(listing_id, listing['owner_id'], listing['active'], listing['starting_bid'],
+                     (listing['category_id'], listing['brand_id'], listing['model_id']), listing['end_time'])
+    bids = Bid.objects.filter(item_bid=listing_id).order_by('id').values_list('bid', 'user_bid')
+    for amount, user_id in bids.iterator(chunk_size=2000):
+        book.amounts.append(amount)
+        book.bidders.append(user_id)
+        if book.leader_id is None or amount > book.price:
+            book.price = amount
+            book.leader_id = user_id
+    book.flushed = len(book.amounts)
+    # Written with the bids, so it belongs to the recovered leader
+    book.maximum = listing['proxy_maximum']
+    book.snapshot = (book.flushed, book.maximum)
+    book.leader_name = listing['leading_bidder__username'] or ''
+    return book
+
+
+class HotAuctionEngine:
+
+    def __init__(self, flush_interval=0.05, flush_size=500, idle_timeout=300):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.idle_timeout = idle_timeout
+        self._books = {}
+        self._queues = {}
+        # Guards _queues and _dirty; taken after _flush_lock when both are needed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = set()
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='hot-auction-flusher', daemon=True)
+        self._flusher.start()
+
+    def submit(self, listing_id, user, amount, proxy=False, timeout=None):
+        return self._call(listing_id, self._bid, user.id, amount, proxy, user.get_username()).result(timeout)
+
+    def close(self, listing_id, timeout=None):
+        # Stop accepting bids for the listing and persist everything it has accepted so far.
+        self._call(listing_id, self._close).result(timeout)
+        self.flush()
+
+    def peek(self, listing_id):
+        return self._books.get(listing_id)
+
+    def _call(self, listing_id, func, *args):
+        future = Future()
+        with self._lock:
+            work = self._queues.get(listing_id)
+            if work is None:
+                work = self._queues[listing_id] = queue.Queue()
+                threading.Thread(target=self._worker, args=(listing_id, work), name=f'hot-auction-{listing_id}',
+                                 daemon=True).start()
+            # Under the lock, so a worker reaping its queue cannot miss the call
+            work.put((func, args, future))
+        return future
+
+    def _worker(self, listing_id, work):
+        try:
+            book = load_book(listing_id)
+        except Exception as error:
+            with self._lock:
+                del self._queues[listing_id]
+            while not work.empty():
+                work.get_nowait()[2].set_exception(error)
+            return
+        finally:
+            connection.close()
+        self._books[listing_id] = book
+        while True:
+            try:
+                func, args, future = work.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                if self._reap(listing_id, work, book):
+                    return
+                continue
+            try:
+                future.set_result(func(book, *args))
+            except Exception as error:
+                future.set_exception(error)
+
+    def _reap(self, listing_id, work, book):
+        # Forget an idle listing once everything it accepted is in the database
+        with self._flush_lock, self._lock:
+            if not work.empty() or listing_id in self._dirty or book.flushed < book.bid_count:
+                return False
+            del self._queues[listing_id]
+            del self._books[listing_id]
+            return True
+
+    def _bid(self, book, user_id, amount, proxy, username):
+        result = book.bid(user_id, amount, proxy, username)
+        if result.status in (ACCEPTED, OUTBID):
+            # Watchers hear about the bid right away, it reaches the database with the next flush
+            pubsub.publish_bid(book.listing_id, result.price, result.bid_count, book.leader_name)
+            with self._lock:
+                book.snapshot = (book.bid_count, book.maximum)
+                self._dirty.add(book.listing_id)
+            if book.bid_count - book.flushed >= self.flush_size:
+                self._wake.set()
+        return result
+
+    def _close(self, book):
+        book.active = False
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing hot auction bids failed, retrying on the next tick")
+            finally:
+                connection.close()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                pending = [(self._books[listing_id], self._books[listing_id].snapshot) for listing_id in dirty]
+            for index, (book, (end, maximum)) in enumerate(pending):
+                try:
+                    self._flush_book(book, end, maximum)
+                except Exception:
+                    with self._lock:
+                        self._dirty.update(entry[0].listing_id for entry in pending[index:])
+                    raise
+
+    def _flush_book(self, book, end, maximum):
+        # The worker only ever appends, so everything below the snapshot's bid count is stable.
+        start = book.flushed
+        bids = [Bid(user_bid_id=book.bidders[i], item_bid_id=book.listing_id, bid=book.amounts[i])
+                for i in range(start, end)]
+        # Who resolve() displaced with the bids up to end; one notice per bidder and batch, at the highest amount
+        outbid, taken = {}, 0
+        while taken < len(book.outbids) and book.outbids[taken][0] <= end:
+            bid_count, user_id, amount = book.outbids[taken]
+            outbid[user_id] = amount
+            taken += 1
+        # No new bids when the leader only raised their maximum; the listing still changes
+        fields = {'proxy_maximum': maximum, 'version': F('version') + 1}
+        if end > start:
+            # Bids accepted by the engine are strictly increasing, so the last one flushed leads.
+            fields.update(current_price=book.amounts[end - 1], bid_count=end, leading_bidder_id=book.bidders[end - 1])
+        with transaction.atomic():
+            Bid.objects.bulk_create(bids, batch_size=self.flush_size)
+            OutbidNotice.objects.bulk_create([OutbidNotice(user_id=user_id, listing_id=book.listing_id, amount=amount)
+                                              for user_id, amount in outbid.items()], batch_size=self.flush_size)
+            Listing.objects.filter(id=book.listing_id).update(**fields)
+        book.flushed = end
+        for _ in range(taken):
+            book.outbids.popleft()
+        pagecache.purge_listing(book.listing_id, *book.taxonomy_ids)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if not getattr(settings, 'AUCTIONS_HOT_ENGINE', False):
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = HotAuctionEngine(
+                flush_interval=getattr(settings, 'AUCTIONS_HOT_FLUSH_INTERVAL', 0.05),
+                flush_size=getattr(settings, 'AUCTIONS_HOT_FLUSH_SIZE', 500),
+                idle_timeout=getattr(settings, 'AUCTIONS_HOT_IDLE_TIMEOUT', 300),
+            )
+            atexit.register(_engine.flush)
+        return _engine
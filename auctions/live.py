@@ -0,0 +1,93 @@
+"""
+Server-sent events for live listing updates, served by commerce/asgi.py at /<listing_id>/events.
+
+Each connection sends the current price, bid count and leader once, then every later accepted bid published on
+the listing's channel (see auctions/pubsub.py), plus a comment line as a heartbeat so proxies keep the idle
+connection open. This is plain ASGI rather than a Django view so a watcher holds no worker thread.
+"""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Listing
+from .pubsub import get_broker, listing_channel
+
+EVENTS_PATH = re.compile(r'^/(?P<listing_id>\d+)/events$')
+
+
+def listing_state(listing_id):
+    state = Listing.objects.filter(id=listing_id) \
+        .values('current_price', 'bid_count', 'leading_bidder__username', 'active').first()
+    if state is None:
+        return None
+    return {'listing': listing_id, 'price': state['current_price'], 'bid_count': state['bid_count'],
+            'leader': state['leading_bidder__username'], 'active': state['active']}
+
+
+def encode_event(message):
+    return f"data: {json.dumps(message)}\n\n".encode()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def listing_events(scope, receive, send, listing_id):
+    # Subscribe before reading the snapshot, so a bid committing in between is queued rather than missed
+    subscription = get_broker().subscribe(listing_channel(listing_id))
+    state = await sync_to_async(listing_state)(listing_id)
+    if state is None:
+        subscription.close()
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Listing not found.'})
+        return
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+    bid_count = state['bid_count']
+    heartbeat = getattr(settings, 'AUCTIONS_EVENTS_HEARTBEAT', 15)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    message = None
+    try:
+        await send({'type': 'http.response.body', 'body': encode_event(state), 'more_body': True})
+        while True:
+            if message is None:
+                message = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({message, disconnected}, timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                return
+            if message in done:
+                event, message = message.result(), None
+                # Bids the snapshot already includes
+                if event['bid_count'] <= bid_count:
+                    continue
+                bid_count = event['bid_count']
+                body = encode_event(event)
+            else:
+                body = b': heartbeat\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        subscription.close()
+        disconnected.cancel()
+        if message is not None:
+            message.cancel()
+
+
+def with_listing_events(application):
+    """Wrap the Django ASGI application, answering GET /<listing_id>/events with a live event stream."""
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = EVENTS_PATH.match(scope['path'])
+            if match:
+                return await listing_events(scope, receive, send, int(match['listing_id']))
+        return await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.db.models import Max
+
+from auctions.bids import ACCEPTED, place_bid
+from auctions.models import User, Listing, Bid
+
+
+def naive_bid(listing_id, user, amount):
+    # The read-compare-insert sequence active_listing used before place_bid, kept for comparison.
+    with transaction.atomic():
+        max_bid = Bid.objects.filter(item_bid=listing_id).aggregate(Max('bid'))['bid__max']
+        if max_bid is None:
+            max_bid = Listing.objects.get(id=listing_id).starting_bid
+        if amount <= max_bid:
+            return False
+        Bid.objects.create(user_bid=user, item_bid_id=listing_id, bid=amount)
+        return True
+
+
+class Command(BaseCommand):
+    help = "Fire N parallel bidders at one listing and report accepted bids/sec and correctness violations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bidders', type=int, default=8, help="Number of concurrent bidder threads.")
+        parser.add_argument('--bids', type=int, default=200, help="Bids each bidder attempts.")
+        parser.add_argument('--strategy', choices=['cas', 'naive'], default='cas',
+                            help="cas uses auctions.bids.place_bid, naive the old read-compare-insert.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark listing and users.")
+
+    def handle(self, *args, **options):
+        owner, bidders, listing = self.setup(options['bidders'])
+        counters = {'accepted': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        start_gate = threading.Barrier(len(bidders))
+
+        def run(user, seed):
+            rng = random.Random(seed)
+            accepted = rejected = errors = 0
+            start_gate.wait()
+            try:
+                for _ in range(options['bids']):
+                    try:
+                        # Reading the price can hit a lock as well; a thread dying here would lose its counts
+                        if options['strategy'] == 'cas':
+                            current = Listing.objects.values_list('current_price', flat=True).get(id=listing.id)
+                        else:
+                            current = Bid.objects.filter(item_bid=listing.id).aggregate(Max('bid'))['bid__max'] or 1
+                        amount = current + rng.randint(1, 3)
+                        if options['strategy'] == 'cas':
+                            ok = place_bid(listing.id, user, amount).status == ACCEPTED
+                        else:
+                            ok = naive_bid(listing.id, user, amount)
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    if ok:
+                        accepted += 1
+                    else:
+                        rejected += 1
+            finally:
+                connection.close()
+            with lock:
+                counters['accepted'] += accepted
+                counters['rejected'] += rejected
+                counters['errors'] += errors
+
+        threads = [threading.Thread(target=run, args=(user, options['seed'] + i)) for i, user in enumerate(bidders)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        violations = self.find_violations(listing, counters['accepted'])
+        self.stdout.write(f"strategy={options['strategy']} bidders={len(bidders)} "
+                          f"attempts={len(bidders) * options['bids']}")
+        self.stdout.write(f"accepted={counters['accepted']} rejected={counters['rejected']} "
+                          f"errors={counters['errors']} elapsed={elapsed:.2f}s "
+                          f"accepted_per_sec={counters['accepted'] / elapsed:.1f}")
+        for violation in violations:
+            self.stdout.write(self.style.ERROR(f"violation: {violation}"))
+        self.stdout.write(f"violations={len(violations)}")
+
+        if not options['keep']:
+            listing.delete()
+            User.objects.filter(id__in=[owner.id] + [user.id for user in bidders]).delete()
+
+    def setup(self, count):
+        password = make_password(None)
+        stamp = int(time.time() * 1000)
+        owner = User.objects.create(username=f"bench-owner-{stamp}", password=password)
+        User.objects.bulk_create([User(username=f"bench-bidder-{stamp}-{i}", password=password) for i in range(count)])
+        bidders = list(User.objects.filter(username__startswith=f"bench-bidder-{stamp}-"))
+        listing = Listing.objects.create(name="Benchmark listing", starting_bid=1, description="", url="", owner=owner)
+        return owner, bidders, listing
+
+    def find_violations(self, listing, reported_accepted):
+        violations = []
+        listing.refresh_from_db()
+        bids = list(Bid.objects.filter(item_bid=listing).order_by('id').values_list('bid', 'user_bid'))
+        if len(bids) != reported_accepted:
+            violations.append(f"{reported_accepted} bids reported accepted but {len(bids)} stored")
+        previous = listing.starting_bid
+        for position, (amount, _) in enumerate(bids):
+            if amount <= previous:
+                violations.append(f"bid #{position} of {amount} does not beat the previous high bid of {previous}")
+            previous = max(previous, amount)
+        if bids:
+            top = max(amount for amount, _ in bids)
+            if sum(1 for amount, _ in bids if amount == top) > 1:
+                violations.append(f"duplicate high bid of {top}")
+        # The denormalized columns are only maintained by the cas strategy
+        if listing.bid_count and listing.bid_count != len(bids):
+            violations.append(f"listing.bid_count={listing.bid_count} but {len(bids)} bids stored")
+        if bids and listing.bid_count and listing.current_price != previous:
+            violations.append(f"listing.current_price={listing.current_price} but max bid is {previous}")
+        return violations
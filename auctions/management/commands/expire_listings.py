@@ -0,0 +1,55 @@
+import heapq
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auctions.expiry import close_expired, upcoming
+from auctions.models import Listing
+from auctions.settlement import settle
+
+
+class Command(BaseCommand):
+    help = "Close listings when their end_time passes. Runs as a worker unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Close what has expired and exit (for cron).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Listings closed per settlement.")
+        parser.add_argument('--refresh', type=float, default=30,
+                            help="Seconds between reloads of the upcoming deadlines, which picks up new listings.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.report(close_expired(batch_size=options['batch_size']))
+            return
+        refresh = timedelta(seconds=options['refresh'])
+        deadlines = []
+        next_refresh = timezone.now()
+        try:
+            while True:
+                now = timezone.now()
+                if now >= next_refresh:
+                    # Sweep too, for listings created with an end_time already past the last reload
+                    self.report(close_expired(now, options['batch_size']))
+                    next_refresh = now + refresh
+                    # Everything ending before the next reload, in a priority queue of (end_time, id)
+                    deadlines = upcoming(next_refresh)
+                    heapq.heapify(deadlines)
+                due = []
+                while deadlines and deadlines[0][0] <= now:
+                    due.append(heapq.heappop(deadlines)[1])
+                for start in range(0, len(due), options['batch_size']):
+                    self.report(settle(Listing.objects.filter(id__in=due[start:start + options['batch_size']],
+                                                             end_time__lte=now)))
+                wake = min(deadlines[0][0], next_refresh) if deadlines else next_refresh
+                close_old_connections()
+                time.sleep(max(0.0, (wake - timezone.now()).total_seconds()))
+        except KeyboardInterrupt:
+            pass
+
+    def report(self, closed):
+        if closed:
+            self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} closed {closed} listing(s)")
+            self.stdout.flush()
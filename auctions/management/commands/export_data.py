@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.exports import EXPORTS, FORMATS, export_queryset, stream_rows
+
+
+class Command(BaseCommand):
+    help = "Stream listings, bids or settled auctions (winners) as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--since', help="First listing date, YYYY-MM-DD.")
+        parser.add_argument('--until', help="Last listing date, YYYY-MM-DD.")
+        parser.add_argument('--category', help="Category name.")
+        parser.add_argument('--active', choices=['true', 'false'])
+        parser.add_argument('--after', type=int, help="Resume after this id (the last one already exported).")
+        parser.add_argument('--output', help="Write to this file instead of stdout. With --after, appended to.")
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_queryset(options['kind'], since=options['since'], until=options['until'],
+                                   category=options['category'], active=options['active'], after=options['after'])
+        except ValueError as e:
+            raise CommandError(e)
+        lines = stream_rows(rows, options['format'])
+        if options['after'] and options['format'] == 'csv':
+            # The file being resumed already has the header
+            next(lines)
+        if options['output']:
+            with open(options['output'], 'a' if options['after'] else 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,155 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from auctions import facets, pagecache, taxonomy
+from auctions.models import User, Listing
+
+MAX_LENGTHS = {'name': 64, 'description': 254, 'url': 254, 'category': 64, 'brand': 64, 'model': 64}
+
+
+def read_rows(path, fmt):
+    # Streams the file; nothing but the current line is held in memory
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class TaxonomyMap:
+    """Name -> id of every Category, Brand and Model, loaded once and extended as rows name new ones."""
+
+    def __init__(self):
+        self.ids = {}
+        self.created = 0
+        for kind, (model, field) in taxonomy.KINDS.items():
+            self.ids[kind] = dict(model.objects.values_list(field, 'id'))
+
+    def resolve(self, kind, name):
+        if not name:
+            return None
+        ids = self.ids[kind]
+        if name not in ids:
+            model, field = taxonomy.KINDS[kind]
+            ids[name] = model.objects.create(**{field: name}).id
+            self.created += 1
+        return ids[name]
+
+
+class Command(BaseCommand):
+    help = "Bulk import listings from a CSV or JSONL file, creating categories, brands and models by name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or JSONL with one object per line. Columns: name, "
+                                         "starting_bid, description, url, and optionally category, brand, model.")
+        parser.add_argument('--owner', required=True, help="Username owning the imported listings.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk INSERT.")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per transaction and checkpoint.")
+        parser.add_argument('--checkpoint', help="Checkpoint file (default: <path>.checkpoint).")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}.")
+
+        done = 0 if options['restart'] else self.read_checkpoint(checkpoint, path)
+        if done:
+            self.stdout.write(f"Resuming after row {done} from {checkpoint}.")
+
+        self.taxonomy = TaxonomyMap()
+        self.owner = owner
+        self.imported = 0
+        start = time.perf_counter()
+        chunk = []
+        try:
+            for number, row in enumerate(read_rows(path, fmt), 1):
+                if number <= done:
+                    continue
+                chunk.append((number, row))
+                if len(chunk) >= options['chunk_size']:
+                    done = self.import_chunk(chunk, options['batch_size'], checkpoint, path, start)
+                    chunk = []
+            if chunk:
+                done = self.import_chunk(chunk, options['batch_size'], checkpoint, path, start)
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f"{e} Rows up to {done} are imported; run again to resume.")
+        finally:
+            # bulk_create sends no signals, so purge the caches they would have
+            if self.taxonomy.created:
+                taxonomy.invalidate()
+            if self.imported:
+                pagecache.purge_all()
+                facets.invalidate()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} listing(s) in {elapsed:.1f}s ({self.imported / max(elapsed, 1e-9):.0f} rows/s), "
+            f"created {self.taxonomy.created} categories/brands/models."))
+
+    def import_chunk(self, chunk, batch_size, checkpoint, path, start):
+        # One transaction per chunk: a failure loses at most the chunk in progress, never half of it
+        with transaction.atomic():
+            listings = [self.build_listing(number, row) for number, row in chunk]
+            Listing.objects.bulk_create(listings, batch_size=batch_size)
+        done = chunk[-1][0]
+        self.imported += len(chunk)
+        self.write_checkpoint(checkpoint, path, done)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{done} rows, {self.imported / max(elapsed, 1e-9):.0f} rows/s")
+        return done
+
+    def build_listing(self, number, row):
+        values = {}
+        for field, max_length in MAX_LENGTHS.items():
+            value = str(row.get(field) or '').strip()
+            if len(value) > max_length:
+                raise ValueError(f"Row {number}: {field} is longer than {max_length} characters.")
+            values[field] = value
+        if not values['name']:
+            raise ValueError(f"Row {number}: name is required.")
+        try:
+            starting_bid = int(row.get('starting_bid'))
+        except (TypeError, ValueError):
+            raise ValueError(f"Row {number}: starting_bid must be a whole number.")
+        if starting_bid < 0:
+            raise ValueError(f"Row {number}: starting_bid must not be negative.")
+        # bulk_create skips Listing.save(), so set what it would have
+        return Listing(
+            name=values['name'], description=values['description'], url=values['url'],
+            starting_bid=starting_bid, current_price=starting_bid, owner=self.owner,
+            category_id=self.taxonomy.resolve('category', values['category']),
+            brand_id=self.taxonomy.resolve('brand', values['brand']),
+            model_id=self.taxonomy.resolve('model', values['model']),
+        )
+
+    def read_checkpoint(self, checkpoint, path):
+        try:
+            with open(checkpoint) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if state.get('path') != os.path.abspath(path):
+            raise CommandError(f"{checkpoint} belongs to {state.get('path')}; pass --restart to ignore it.")
+        return state['rows']
+
+    def write_checkpoint(self, checkpoint, path, rows):
+        # Written after the commit and swapped in atomically, so it never claims rows that were rolled back
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'rows': rows}, f)
+        os.replace(tmp, checkpoint)
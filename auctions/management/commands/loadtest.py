@@ -0,0 +1,274 @@
+import http.client
+import json
+import logging
+import math
+import random
+import re
+import subprocess
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connections
+from django.urls import resolve
+
+from auctions.management.commands.seed import WORDS, Weights
+from auctions.models import User, Listing, Category
+
+SCENARIOS = ('browse', 'detail', 'bid', 'watchlist', 'comment')
+DEFAULT_MIX = 'browse=50,detail=30,bid=10,watchlist=5,comment=5'
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_mix(value):
+    try:
+        mix = {name: float(weight) for name, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise CommandError(f"Invalid --mix {value!r}, expected e.g. {DEFAULT_MIX}.")
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise CommandError(f"Unknown scenario(s) in --mix: {', '.join(sorted(unknown))}.")
+    return mix
+
+
+def change(old, new):
+    return f"{(new - old) / old * 100:+.0f}%" if old else 'n/a'
+
+
+def percentile(ordered, share):
+    # Nearest rank on an already sorted list
+    return ordered[max(0, math.ceil(round(share * len(ordered), 6)) - 1)]
+
+
+class Client:
+    """One simulated user: a cookie jar and a fresh connection per request, like a browser without keep-alive."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if data is not None:
+            if 'csrftoken' in self.cookies:
+                data = {'csrfmiddlewaretoken': self.cookies['csrftoken'], **data}
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+            for header in response.headers.get_all('Set-Cookie') or ():
+                for name, morsel in SimpleCookie(header).items():
+                    self.cookies[name] = morsel.value
+            return response.status, content
+        finally:
+            connection.close()
+
+    def login(self, username, password):
+        status, content = self.request('GET', '/login')
+        match = CSRF_INPUT.search(content.decode())
+        status, _ = self.request('POST', '/login', {'username': username, 'password': password,
+                                                    'csrfmiddlewaretoken': match[1] if match else ''})
+        if 'sessionid' not in self.cookies:
+            raise CommandError(f"Could not log in as {username} (status {status}); is the database seeded?")
+
+
+class Command(BaseCommand):
+    help = "Serve the project in-process and replay a traffic mix from concurrent clients, reporting " \
+           "throughput and p50/p95/p99 latency per method and URL name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8, help="Concurrent logged-in clients.")
+        parser.add_argument('--anonymous', type=int, default=0,
+                            help="Additional anonymous clients, which only browse and view listings.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to measure.")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured traffic first.")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help="Relative weights of the scenarios.")
+        parser.add_argument('--password', default='password', help="Password of the seeded users.")
+        parser.add_argument('--hot', type=int, default=1000,
+                            help="Listings the traffic goes to, picked with a skewed popularity.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--seed-db', action='store_true', help="Run `manage.py seed` with its defaults first.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Results JSON of an earlier run to print the changes against.")
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on: every query is kept in memory and timings are not representative.")
+        if options['seed_db']:
+            call_command('seed', seed=options['seed'], stdout=self.stdout)
+        self.rng = random.Random(options['seed'])
+        self.mix = parse_mix(options['mix'])
+        self.prepare(options['hot'], options['clients'])
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(get_internal_wsgi_application())
+        # Over-budget warnings would drown the report, the budgets have their own tests. Set after loading the
+        # application, which configures logging again.
+        logging.getLogger('auctions.queries').setLevel(logging.ERROR)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        try:
+            clients = []
+            for username in self.usernames:
+                client = Client(port)
+                client.login(username, options['password'])
+                clients.append((client, self.mix))
+            browse_only = {name: weight for name, weight in self.mix.items() if name in ('browse', 'detail')}
+            clients += [(Client(port), browse_only) for _ in range(options['anonymous'])]
+            results = self.run(clients, options['warmup'], options['duration'])
+        finally:
+            server.shutdown()
+            server.server_close()
+            connections.close_all()
+
+        report = {
+            'commit': self.git_commit(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'clients': options['clients'],
+            'anonymous': options['anonymous'],
+            'duration': options['duration'],
+            'mix': self.mix,
+            'database': settings.DATABASES['default']['ENGINE'],
+            'routes': results,
+        }
+        self.print_report(results)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+    def prepare(self, hot, clients):
+        listings = list(Listing.objects.filter(active=True).order_by('-id').values_list('id', 'current_price')[:hot])
+        # The users `manage.py seed` creates, who all share --password
+        users = list(User.objects.filter(username__regex=r'^user[0-9]+$').order_by('id')
+                     .values_list('username', flat=True)[:clients])
+        if not listings or len(users) < clients:
+            raise CommandError("Needs active listings and a user per client; run `manage.py seed` or pass --seed-db.")
+        self.usernames = users
+        self.listings = [listing_id for listing_id, price in listings]
+        # Last bid per listing, shared by all clients so most bids are accepted
+        self.prices = dict(listings)
+        self.prices_lock = threading.Lock()
+        self.popularity = Weights(self.rng, len(self.listings), 1.2)
+        self.categories = list(Category.objects.values_list('category', flat=True)[:50])
+
+    def request_for(self, scenario, rng):
+        listing_id = self.listings[self.popularity.pick(rng)]
+        if scenario == 'browse':
+            choice = rng.randrange(4)
+            if choice == 0 or not self.categories:
+                return 'GET', '/', None
+            if choice == 1:
+                return 'GET', f'/category/{quote(rng.choice(self.categories))}', None
+            if choice == 2:
+                return 'GET', '/browse?' + urlencode({'category': rng.choice(self.categories)}), None
+            return 'GET', '/search?' + urlencode({'q': rng.choice(WORDS)}), None
+        if scenario == 'detail':
+            return 'GET', f'/{listing_id}', None
+        if scenario == 'bid':
+            with self.prices_lock:
+                self.prices[listing_id] += rng.randint(1, 5)
+                amount = self.prices[listing_id]
+            return 'POST', f'/{listing_id}', {'bid_form': amount}
+        if scenario == 'watchlist':
+            return 'POST', '/watchlist', {'listing_id': listing_id}
+        return 'POST', '/comment', {'listing_id': listing_id, 'comment': ' '.join(rng.choices(WORDS, k=8))}
+
+    def run(self, clients, warmup, duration):
+        samples = {}
+        lock = threading.Lock()
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop_at = measure_from + duration
+
+        def work(client, mix, seed):
+            rng = random.Random(seed)
+            names, weights = list(mix), list(mix.values())
+            local = {}
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    break
+                method, path, data = self.request_for(rng.choices(names, weights)[0], rng)
+                route = f"{method} {resolve(path.split('?')[0]).url_name}"
+                began = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, data)
+                except (OSError, http.client.HTTPException):
+                    status = None
+                elapsed = time.perf_counter() - began
+                if began >= measure_from:
+                    latencies, errors = local.setdefault(route, ([], [0]))
+                    latencies.append(elapsed)
+                    if status is None or status >= 500:
+                        errors[0] += 1
+            with lock:
+                for route, (latencies, errors) in local.items():
+                    merged = samples.setdefault(route, ([], [0]))
+                    merged[0].extend(latencies)
+                    merged[1][0] += errors[0]
+
+        threads = [threading.Thread(target=work, args=(client, mix, self.rng.random())) for client, mix in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results = {}
+        for route, (latencies, errors) in sorted(samples.items()):
+            latencies.sort()
+            results[route] = {
+                'requests': len(latencies),
+                'errors': errors[0],
+                'rps': round(len(latencies) / duration, 1),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            }
+        return results
+
+    def print_report(self, results):
+        self.stdout.write(f"{'route':<24}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'p99 ms':>9}")
+        for route, row in results.items():
+            self.stdout.write(f"{route:<24}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9}"
+                              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+        total = sum(row['requests'] for row in results.values())
+        self.stdout.write(f"{'total':<24}{total:>10}{sum(row['errors'] for row in results.values()):>8}"
+                          f"{round(sum(row['rps'] for row in results.values()), 1):>9}")
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f"Compared with {before.get('commit') or before.get('started')}:")
+        for route, row in after['routes'].items():
+            old = before['routes'].get(route)
+            if old is None:
+                continue
+            changes = [f"{key} {change(old[key], row[key])}" for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+            self.stdout.write(f"{route:<24}{'  '.join(changes)}")
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from auctions import pagecache
+
+
+class Command(BaseCommand):
+    help = "Show the hit/miss/stale counters of the anonymous page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them.")
+
+    def handle(self, *args, **options):
+        stats = pagecache.stats()
+        total = sum(stats.values())
+        for outcome, count in stats.items():
+            share = f"{count / total:.1%}" if total else "-"
+            self.stdout.write(f"{outcome:<6} {count:>10} {share:>7}")
+        if options['reset']:
+            pagecache.reset_stats()
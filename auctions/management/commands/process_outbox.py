@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auctions.settlement import process_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver the notices written by settlement: drain the outbox in batches. Runs as a worker unless " \
+           "--once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain what is due and exit (for cron).")
+        parser.add_argument('--batch-size', type=int, default=100, help="Events claimed per batch.")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds to wait when nothing is due.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                handled, failed = process_outbox(options['batch_size'])
+                if handled or failed:
+                    self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} handled {handled} event(s), "
+                                      f"{failed} failed")
+                    self.stdout.flush()
+                    continue
+                if options['once']:
+                    return
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.api import idempotency_ttl
+from auctions.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = "Delete the idempotency records of API bids older than AUCTIONS_IDEMPOTENCY_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Records deleted per DELETE.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - idempotency_ttl()
+        total = 0
+        while True:
+            ids = list(IdempotencyRecord.objects.filter(created__lt=cutoff).order_by('created')
+                       .values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {total} expired idempotency record(s).")
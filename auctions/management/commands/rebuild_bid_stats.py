@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from auctions import pagecache
+from auctions.bids import rebuild_bid_stats
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized current_price, bid_count and leading_bidder of listings from the Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('listing_ids', nargs='*', type=int, help="Only rebuild these listings (default: all).")
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.all()
+        if options['listing_ids']:
+            listings = listings.filter(id__in=options['listing_ids'])
+        updated = rebuild_bid_stats(listings)
+        pagecache.purge_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt bid stats for {updated} listing(s)."))
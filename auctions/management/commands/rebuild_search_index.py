@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from auctions import search
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text search table and its triggers and reindex every listing."
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("Full-text search needs SQLite; other databases search with icontains.")
+        # Dropped first, so a table or trigger left behind by an older definition is replaced too
+        with transaction.atomic():
+            search.uninstall()
+            search.install(rebuild=True)
+        search.query_cache.clear()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
@@ -0,0 +1,248 @@
+import random
+import time
+from array import array
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from auctions import facets, pagecache, taxonomy
+from auctions.models import User, Category, Brand, Model, Listing, Bid, Watchlist, Comment
+
+WORDS = ('vintage', 'classic', 'red', 'blue', 'black', 'silver', 'compact', 'sport', 'touring', 'city', 'racing',
+         'electric', 'folding', 'carbon', 'steel', 'leather', 'wooden', 'antique', 'modern', 'restored', 'rare',
+         'limited', 'original', 'custom', 'mint', 'used', 'new', 'spare', 'heavy', 'light')
+THINGS = ('bike', 'car', 'moped', 'scooter', 'helmet', 'wheel', 'lamp', 'saddle', 'engine', 'mirror', 'jacket',
+          'watch', 'camera', 'radio', 'guitar', 'chair', 'table', 'clock', 'frame', 'toolbox')
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # auto_now_add would overwrite the generated dates in bulk_create
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Weights:
+    """Pareto-distributed popularity weights with O(log n) weighted sampling."""
+
+    def __init__(self, rng, n, alpha):
+        self.weights = array('d', (rng.paretovariate(alpha) for _ in range(n)))
+        self.cumulative = array('d')
+        total = 0.0
+        for weight in self.weights:
+            total += weight
+            self.cumulative.append(total)
+        self.total = total
+
+    def pick(self, rng):
+        return min(bisect(self.cumulative, rng.random() * self.total), len(self.weights) - 1)
+
+    def shares(self, amount):
+        # Split `amount` in proportion to the weights; the floors of the running sum keep the exact total
+        previous = 0
+        for cumulative in self.cumulative:
+            current = int(amount * cumulative / self.total)
+            yield current - previous
+            previous = current
+
+
+class Command(BaseCommand):
+    help = "Fill the database with reproducible synthetic users, taxonomy, listings, bids, watchlists and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--bids', type=int, default=100000)
+        parser.add_argument('--watchlists', type=int, default=20000, help="Watchlist entries in total.")
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--brands', type=int, default=100)
+        parser.add_argument('--models', type=int, default=500)
+        parser.add_argument('--alpha', type=float, default=1.5,
+                            help="Pareto shape of listing popularity; lower means a heavier tail.")
+        parser.add_argument('--closed', type=float, default=0.3, help="Share of (the oldest) listings closed.")
+        parser.add_argument('--days', type=int, default=365, help="Listing dates spread over this many days.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 and options['bids']:
+            raise CommandError("Bids need at least two users, an owner and a bidder.")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        with explicit_dates(Listing._meta.get_field('date'), Comment._meta.get_field('date')):
+            self.users = self.seed_users(options['users'], options['password'], options['seed'])
+            self.taxonomy = {
+                'category': self.seed_taxonomy(Category, 'category', options['categories']),
+                'brand': self.seed_taxonomy(Brand, 'brand', options['brands']),
+                'model': self.seed_taxonomy(Model, 'model', options['models']),
+            }
+            popularity = Weights(self.rng, options['listings'], options['alpha'])
+            self.listings = self.seed_listings(popularity, options['bids'], options['closed'], options['days'])
+            self.seed_watchlists(popularity, options['watchlists'])
+            self.seed_comments(popularity, options['comments'])
+
+        # Explicit ids leave sequences behind on databases that have them
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [User, Category, Brand, Model, Listing, Bid,
+                                                                      Watchlist, Comment])
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+        # bulk_create sends no signals
+        taxonomy.invalidate()
+        pagecache.purge_all()
+        facets.invalidate()
+
+    def next_id(self, model):
+        return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def batched(self, model, rows, label):
+        # Insert a generator of unsaved objects batch by batch, one transaction per batch
+        start = time.perf_counter()
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                count += self.flush(model, batch)
+                batch = []
+        count += self.flush(model, batch)
+        self.report(label, count, start)
+
+    def flush(self, model, batch):
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+        return len(batch)
+
+    def seed_users(self, count, password, seed):
+        # Hashing is deliberately slow, so every user shares one hash computed up front
+        password_hash = make_password(password, salt=f'seed{seed}')
+        first = self.next_id(User)
+        ids = range(first, first + count)
+        self.batched(User, (User(id=user_id, username=f'user{user_id}', email=f'user{user_id}@example.com',
+                                 password=password_hash) for user_id in ids), 'users')
+        return ids
+
+    def seed_taxonomy(self, model, field, count):
+        first = self.next_id(model)
+        ids = range(first, first + count)
+        self.batched(model, (model(**{'id': item_id, field: f'{self.rng.choice(WORDS)} {field} {item_id}'})
+                             for item_id in ids), field)
+        return ids
+
+    def pick(self, ids):
+        # Taxonomy is skewed too: a few categories, brands and models carry most listings
+        if not ids:
+            return None
+        return ids[min(int(self.rng.paretovariate(1.0)) - 1, len(ids) - 1)]
+
+    def seed_listings(self, popularity, total_bids, closed, days):
+        first = self.next_id(Listing)
+        ids = range(first, first + len(popularity.weights))
+        bid_id = self.next_id(Bid)
+        closed_until = int(len(ids) * closed)
+        self.span = timedelta(days=days)
+        start = time.perf_counter()
+        listings, bids, bid_total = [], [], 0
+
+        for index, (listing_id, bid_count) in enumerate(zip(ids, popularity.shares(total_bids))):
+            owner = self.rng.choice(self.users)
+            starting_bid = max(1, int(self.rng.lognormvariate(4.5, 1.2)))
+            # Each bid beats the previous one, so the denormalized stats are known before inserting
+            price, leader = starting_bid, None
+            for _ in range(bid_count):
+                # Steps relative to the starting bid; compounding would overflow on the most popular listings
+                price += max(1, int(starting_bid * self.rng.uniform(0.01, 0.05)))
+                leader = self.rng.choice(self.users)
+                while leader == owner:
+                    leader = self.rng.choice(self.users)
+                bids.append((bid_id, listing_id, leader, price))
+                bid_id += 1
+            active = index >= closed_until
+            listings.append(Listing(
+                id=listing_id, name=f'{self.rng.choice(WORDS).capitalize()} {self.rng.choice(THINGS)}',
+                description=' '.join(self.rng.choices(WORDS + THINGS, k=self.rng.randint(5, 25))),
+                url='', starting_bid=starting_bid, owner_id=owner,
+                date=self.listing_date(index, len(ids)),
+                category_id=self.pick(self.taxonomy['category']), brand_id=self.pick(self.taxonomy['brand']),
+                model_id=self.pick(self.taxonomy['model']),
+                current_price=price, bid_count=bid_count, leading_bidder_id=leader,
+                active=active, winner_id=None if active else leader,
+                final_price=price if not active and leader else None,
+            ))
+            if len(listings) >= self.batch_size or len(bids) >= self.batch_size:
+                bid_total += self.flush_listings(listings, bids)
+                listings, bids = [], []
+        bid_total += self.flush_listings(listings, bids)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"listings: {len(ids)} rows and bids: {bid_total} rows in {elapsed:.1f}s "
+                          f"({(len(ids) + bid_total) / max(elapsed, 1e-9):.0f} rows/s)")
+        return ids
+
+    def listing_date(self, index, count):
+        # Spread evenly and increasing with the id, like listings created one after another
+        return self.now - self.span + self.span * (index + 1) / count
+
+    def flush_listings(self, listings, bids):
+        # Bids are most of the rows; plain tuples through executemany skip building a model instance for each
+        opts = Bid._meta
+        columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column)
+                            for name in ('id', 'item_bid', 'user_bid', 'bid'))
+        sql = f"INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) VALUES (%s, %s, %s, %s)"
+        with transaction.atomic():
+            Listing.objects.bulk_create(listings, batch_size=self.batch_size)
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, bids)
+        return len(bids)
+
+    def seed_watchlists(self, popularity, count):
+        # Popular listings are watched more; a user watches a listing at most once
+        seen = set()
+        first = self.next_id(Watchlist)
+
+        def rows():
+            attempts = 0
+            while len(seen) < count and attempts < count * 10:
+                attempts += 1
+                pair = (self.rng.choice(self.users), self.listings[popularity.pick(self.rng)])
+                if pair not in seen:
+                    seen.add(pair)
+                    yield Watchlist(id=first + len(seen) - 1, user_watchlist_id=pair[0], listing_item_id=pair[1])
+
+        if self.listings:
+            self.batched(Watchlist, rows(), 'watchlists')
+
+    def seed_comments(self, popularity, count):
+        first = self.next_id(Comment)
+
+        def rows():
+            for comment_id in range(first, first + count):
+                index = popularity.pick(self.rng)
+                date = self.listing_date(index, len(self.listings))
+                yield Comment(id=comment_id, user_comment_id=self.rng.choice(self.users),
+                              listing_comment_id=self.listings[index],
+                              comment=' '.join(self.rng.choices(WORDS + THINGS, k=self.rng.randint(3, 30))),
+                              date=date + (self.now - date) * self.rng.random())
+
+        if self.listings:
+            self.batched(Comment, rows(), 'comments')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auctions import notifications
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbid notices in batches, one per user and listing within AUCTIONS_OUTBID_WINDOW. " \
+           "Runs as a worker unless --once or --stats is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is due and exit (for cron).")
+        parser.add_argument('--batch-size', type=int, default=100, help="(user, listing) pairs per batch.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to wait when nothing is due.")
+        parser.add_argument('--stats', action='store_true', help="Print queue depth, lag and counters, then exit.")
+        parser.add_argument('--reset', action='store_true', help="With --stats, reset the counters after printing.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in notifications.stats().items():
+                self.stdout.write(f"{name:<20} {value:>10}")
+            if options['reset']:
+                notifications.reset_stats()
+            return
+        transport = notifications.get_transport()
+        try:
+            while True:
+                handled = notifications.deliver(options['batch_size'], transport=transport)
+                if handled:
+                    self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} handled {handled} notice(s)")
+                    self.stdout.flush()
+                    continue
+                if options['once']:
+                    return
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
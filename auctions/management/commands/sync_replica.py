@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from auctions.replicas import copy_sqlite
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the SQLite replicas of DATABASE_REPLICAS, to run the replica " \
+           "router locally. Copies once unless --interval is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Seconds between copies; keeps running.")
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("The primary is not SQLite; replicate it with the database's own replication.")
+        replicas = [alias for alias in getattr(settings, 'DATABASE_REPLICAS', [])
+                    if connections[alias].vendor == 'sqlite']
+        if not replicas:
+            raise CommandError("No SQLite replicas configured, set DJANGO_SQLITE_REPLICAS.")
+        source = connections['default'].settings_dict['NAME']
+        try:
+            while True:
+                start = time.perf_counter()
+                for alias in replicas:
+                    copy_sqlite(source, connections[alias].settings_dict['NAME'])
+                self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} copied to {', '.join(replicas)} in "
+                                  f"{(time.perf_counter() - start) * 1000:.0f} ms")
+                self.stdout.flush()
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
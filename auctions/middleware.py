@@ -0,0 +1,125 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from . import pagecache, replicas
+from .budgets import QUERY_BUDGETS
+
+logger = logging.getLogger('auctions.queries')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """Database execute wrapper counting the statements, time and repeated statements of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+class QueryBudgetMiddleware:
+    """
+    Report the SQL queries of every request in X-Query-Count, X-Query-Time-Ms and X-Query-Duplicates headers
+    and a JSON log line on the auctions.queries logger, and check them against the budget of the URL name
+    (settings.QUERY_BUDGETS, by default auctions.budgets.QUERY_BUDGETS).
+
+    QUERY_BUDGET_MODE decides what happens to a view over budget: 'warn' logs a warning, 'raise' raises
+    QueryBudgetExceeded, and 'off' only reports.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = getattr(settings, 'QUERY_BUDGETS', QUERY_BUDGETS).get(url_name)
+        response['X-Query-Count'] = str(stats.count)
+        response['X-Query-Time-Ms'] = f"{stats.time * 1000:.1f}"
+        response['X-Query-Duplicates'] = str(stats.duplicates)
+        logger.info(json.dumps({
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'query_time_ms': round(stats.time * 1000, 1),
+            'duplicates': stats.duplicates,
+            'budget': budget,
+        }))
+
+        if budget is not None and stats.count > budget:
+            mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+            message = f"{request.method} {request.path} ({url_name}) ran {stats.count} queries, budget is {budget}"
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            if mode == 'warn':
+                logger.warning(message)
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Serve the browse pages of auctions.pagecache from the cache to anonymous users. Pages are only stored if
+    rendering them set no cookie and used no CSRF token, so nothing session-dependent ends up in the cache.
+    Responses carry X-Page-Cache: HIT, MISS or STALE. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cached = getattr(request, '_page_cache', None)
+        if cached is not None:
+            group, generation, outcome = cached
+            response['X-Page-Cache'] = outcome.upper()
+            if response.status_code == 200 and not response.streaming and not response.cookies \
+                    and not request.META.get('CSRF_COOKIE_USED'):
+                # A page read from a replica may predate the purge it is stored after, so it only lives briefly
+                timeout = getattr(settings, 'REPLICA_PAGE_CACHE_TIMEOUT', 10) if replicas.read_replica() else None
+                pagecache.store_page(group, request.get_full_path(), generation, response, timeout)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # Routes that are never cached do not check the user, which would load the session
+        group = pagecache.page_group(request.resolver_match.url_name, view_kwargs)
+        if group is None or request.user.is_authenticated:
+            return None
+        outcome, page, generation = pagecache.get_page(group, request.get_full_path())
+        if outcome == pagecache.HIT:
+            response = HttpResponse(page['content'], content_type=page['content_type'])
+            response['X-Page-Cache'] = 'HIT'
+            return response
+        request._page_cache = (group, generation, outcome)
+        return None
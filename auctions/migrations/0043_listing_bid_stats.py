@@ -0,0 +1,46 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    bids = Bid.objects.filter(item_bid=OuterRef('pk'))
+    top_bid = bids.order_by('-bid', 'id')
+    bid_count = bids.order_by().values('item_bid').annotate(count=Count('id')).values('count')
+    Listing.objects.update(
+        bid_count=Coalesce(Subquery(bid_count), 0),
+        current_price=Coalesce(Subquery(top_bid.values('bid')[:1]), F('starting_bid')),
+        leading_bidder=Subquery(top_bid.values('user_bid')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0042_brand_category_model_alter_listing_brand_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='leading_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_bidder', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0043_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='hot',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+import django.db.models.deletion
+
+
+def remove_duplicates(apps, schema_editor):
+    # The new unique constraints would fail on existing duplicates: keep the oldest row of each
+    # taxonomy name and point its listings at it, and keep one watchlist entry per user and listing.
+    Listing = apps.get_model('auctions', 'Listing')
+    for model_name in ('Category', 'Brand', 'Model'):
+        field = model_name.lower()
+        model = apps.get_model('auctions', model_name)
+        duplicates = model.objects.values(field).annotate(keep=Min('id'), rows=Count('id')).filter(rows__gt=1)
+        for duplicate in duplicates:
+            others = model.objects.filter(**{field: duplicate[field]}).exclude(id=duplicate['keep'])
+            Listing.objects.filter(**{f'{field}__in': others}).update(**{field: duplicate['keep']})
+            others.delete()
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    duplicates = Watchlist.objects.values('user_watchlist', 'listing_item') \
+        .annotate(keep=Min('id'), rows=Count('id')).filter(rows__gt=1)
+    for duplicate in duplicates:
+        Watchlist.objects.filter(user_watchlist=duplicate['user_watchlist'], listing_item=duplicate['listing_item']) \
+            .exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0044_listing_hot'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bid',
+            name='item_bid',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='item_bid', to='auctions.listing'),
+        ),
+        migrations.AlterField(
+            model_name='brand',
+            name='brand',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='category',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='model',
+            name='model',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='watchlist',
+            name='user_watchlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_watchlist', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['item_bid', '-bid'], name='bid_item_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-date', '-id'], name='listing_active_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user_watchlist', 'listing_item'), name='unique_watchlist_item'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# The FTS5 index as this migration created it, kept literal so later changes to auctions/search.py do not
+# change what the migration does. search.reinstall_triggers() restores the triggers after later migrations.
+INSTALL_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts USING fts5(
+        name, description, content='auctions_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_update AFTER UPDATE OF name, description ON auctions_listing
+    BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO auctions_listing_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    "INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')",
+]
+
+UNINSTALL_SQL = [
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_insert",
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_update",
+    "DROP TABLE IF EXISTS auctions_listing_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def operation(apps, schema_editor):
+        # Other databases search with icontains
+        if schema_editor.connection.vendor == 'sqlite':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0047_listing_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(INSTALL_SQL), run_on_sqlite(UNINSTALL_SQL)),
+    ]
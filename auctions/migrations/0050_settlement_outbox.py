@@ -0,0 +1,48 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_final_price(apps, schema_editor):
+    # Listings closed before settlement existed; no outbox events are written for them
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.filter(active=False, winner__isnull=False).update(final_price=models.F('current_price'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0049_listing_end_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='final_price',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_final_price, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('winner_notice', 'Winner notice'), ('loser_notices', 'Loser notices'), ('owner_summary', 'Owner summary')], max_length=32)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('progress', models.IntegerField(default=0)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('listing', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='outbox_events', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['available_at', 'id'], name='outbox_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='outboxevent',
+            constraint=models.UniqueConstraint(fields=('listing', 'kind'), name='unique_outbox_event'),
+        ),
+    ]
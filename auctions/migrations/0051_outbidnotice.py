@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0050_settlement_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutbidNotice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='outbid_notices', to='auctions.listing')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='outbid_notices', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
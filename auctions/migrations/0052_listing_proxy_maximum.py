@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0051_outbidnotice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='proxy_maximum',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -7,21 +8,21 @@ class User(AbstractUser):
 
 
 class Category(models.Model):
-    category = models.CharField(max_length=64)
+    category = models.CharField(max_length=64, unique=True)
 
     def __str__(self):
         return f"{self.category}"
 
 
 class Brand(models.Model):
-    brand = models.CharField(max_length=64)
+    brand = models.CharField(max_length=64, unique=True)
 
     def __str__(self):
         return f"{self.brand}"
 
 
 class Model(models.Model):
-    model = models.CharField(max_length=64)
+    model = models.CharField(max_length=64, unique=True)
 
     def __str__(self):
         return f"{self.model}"
@@ -42,23 +43,87 @@ class Listing(models.Model):
     active = models.BooleanField(default=True)
     winner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='winner', null=True, blank=True)
 
+    # Denormalized from Bid, kept up to date by auctions.bids in the same transaction that inserts a Bid.
+    # Rebuild with `manage.py rebuild_bid_stats` if they ever drift.
+    current_price = models.IntegerField(default=0)
+    bid_count = models.IntegerField(default=0)
+    leading_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='leading_bidder', null=True,
+                                       blank=True)
+    # Changes whenever the listing or its bids change; part of the cache keys of the listing
+    version = models.PositiveIntegerField(default=1)
+    # Take bids through the in-memory engine in auctions.hot (needs AUCTIONS_HOT_ENGINE = True)
+    hot = models.BooleanField(default=False)
+    # No bids are accepted after end_time; `manage.py expire_listings` closes the listing (see auctions/expiry.py)
+    end_time = models.DateTimeField(null=True, blank=True)
+    # Hidden maximum of the leading bidder's proxy bid, None when it is no higher than current_price
+    # (see auctions/proxy.py)
+    proxy_maximum = models.IntegerField(null=True, blank=True)
+    # Written when the listing is settled (see auctions/settlement.py); None when it closed without bids
+    final_price = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Partial rather than (active, date): SQLite compiles filter(active=True) to a bare `WHERE active`,
+            # which can use a partial index but not a composite one led by the flag.
+            models.Index(fields=['-date', '-id'], condition=models.Q(active=True), name='listing_active_date_idx'),
+            # Keyset pages of the category/brand/model views
+            models.Index(fields=['category', '-date', '-id'], condition=models.Q(active=True),
+                         name='listing_category_date_idx'),
+            models.Index(fields=['brand', '-date', '-id'], condition=models.Q(active=True),
+                         name='listing_brand_date_idx'),
+            models.Index(fields=['model', '-date', '-id'], condition=models.Q(active=True),
+                         name='listing_model_date_idx'),
+            # Upcoming deadlines for the expiry worker
+            models.Index(fields=['end_time'], condition=models.Q(active=True, end_time__isnull=False),
+                         name='listing_active_end_idx'),
+        ]
+
+    @property
+    def ended(self):
+        return self.end_time is not None and self.end_time <= timezone.now()
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            if not self.bid_count:
+                self.current_price = self.starting_bid
+            super().save(*args, **kwargs)
+            return
+        # Bumped in SQL, so saving a stale instance still moves past versions written by bids in the meantime
+        self.version = models.F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
     def __str__(self):
         return f"{self.name} {self.starting_bid}€ {self.owner}"
 
 
 class Watchlist(models.Model):
-    user_watchlist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_watchlist')
+    # Indexed through the leading column of unique_watchlist_item
+    user_watchlist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_watchlist', db_index=False)
     listing_item = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='listing_item')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_watchlist', 'listing_item'], name='unique_watchlist_item'),
+        ]
+
     def __str__(self):
         return f"{self.user_watchlist} {self.listing_item}"
 
 
 class Bid(models.Model):
     user_bid = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_bid')
-    item_bid = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='item_bid')
+    # Indexed through the leading column of bid_item_amount_idx
+    item_bid = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='item_bid', db_index=False)
     bid = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item_bid', '-bid'], name='bid_item_amount_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user_bid} {self.item_bid.name} {self.bid}"
 
@@ -72,3 +137,73 @@ class Comment(models.Model):
 
     def __str__(self):
         return f"{self.user_comment} {self.listing_comment.name} {self.comment}"
+
+
+class OutboxEvent(models.Model):
+    """Work left for after a listing closes, written in the transaction that closed it (see auctions/settlement.py)."""
+    WINNER_NOTICE = 'winner_notice'
+    LOSER_NOTICES = 'loser_notices'
+    OWNER_SUMMARY = 'owner_summary'
+    KINDS = [
+        (WINNER_NOTICE, 'Winner notice'),
+        (LOSER_NOTICES, 'Loser notices'),
+        (OWNER_SUMMARY, 'Owner summary'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KINDS)
+    # Indexed through the leading column of unique_outbox_event
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='outbox_events', db_index=False)
+    created = models.DateTimeField(auto_now_add=True)
+    # Not picked up before this time: pushed back while a worker holds the event and after a failure
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Last user id notified, for events that fan out over several batches
+    progress = models.IntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Closing a listing twice must not notify twice
+            models.UniqueConstraint(fields=['listing', 'kind'], name='unique_outbox_event'),
+        ]
+        indexes = [
+            models.Index(fields=['available_at', 'id'], condition=models.Q(processed_at__isnull=True),
+                         name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.listing_id}"
+
+
+class OutbidNotice(models.Model):
+    """A bidder lost the lead on a listing. Queued at bid time, delivered by auctions/notifications.py."""
+    # The queue only holds undelivered rows, so the foreign keys go without indexes to keep bids cheap
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outbid_notices', db_index=False)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='outbid_notices', db_index=False)
+    # The bid that took the lead
+    amount = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user} {self.listing_id} {self.amount}"
+
+
+class IdempotencyRecord(models.Model):
+    """The outcome of a JSON API bid, replayed to retries carrying the same Idempotency-Key (see auctions/api.py)."""
+    # Indexed through the leading column of unique_idempotency_key
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records', db_index=False)
+    key = models.CharField(max_length=255)
+    # Digest of the request the key was first used with; reusing a key for another request is an error
+    fingerprint = models.CharField(max_length=64)
+    # None while the bid is being placed
+    response = models.JSONField(null=True)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.key}"
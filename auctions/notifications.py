@@ -0,0 +1,129 @@
+"""
+Outbid notices.
+
+A bid that takes the lead queues an OutbidNotice for the bidder it displaced, in the transaction that accepts
+it: a lookup of the previous leader where the bid did not already read it, and one INSERT, no mail on the
+request path. The hot engine queues them with its write-behind batches instead.
+
+`manage.py send_outbid_notices` delivers them. A notice waits AUCTIONS_OUTBID_WINDOW seconds, and everything
+queued for the same user and listing until then goes out as one message, so a bidding war sends one notice
+per user and listing rather than one per bid. Nothing is sent to a bidder who leads again by then or for a
+listing that has closed, settlement mails those (see auctions/settlement.py). Delivered rows are deleted, so
+the table only ever holds the queue. Run a single worker; two would deliver the same batch twice.
+
+Delivery goes through the transport named by AUCTIONS_NOTIFICATION_TRANSPORT: a class whose send(notices)
+takes a list of Notice. The default, EmailTransport, mails through EMAIL_BACKEND.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Listing, OutbidNotice, User
+
+# count is how many times the user was outbid on the listing within the window, amount the highest bid since
+Notice = namedtuple('Notice', ['user_id', 'username', 'email', 'listing_id', 'listing_name', 'amount', 'count'])
+
+DELIVERED = 'delivered'
+COALESCED = 'coalesced'
+SKIPPED = 'skipped'
+LAG_MS = 'lag_ms'
+STATS_KEYS = {name: f'notifications:stats:{name}' for name in (DELIVERED, COALESCED, SKIPPED, LAG_MS)}
+
+
+class EmailTransport:
+
+    def send(self, notices):
+        messages = [EmailMessage(
+            f"You have been outbid on {notice.listing_name}",
+            f"Hello {notice.username}, someone bid {notice.amount} € on {notice.listing_name}"
+            + (f" ({notice.count} bids over yours)." if notice.count > 1 else "."),
+            to=[notice.email]) for notice in notices if notice.email]
+        if messages:
+            with get_connection() as connection:
+                connection.send_messages(messages)
+
+
+def get_transport():
+    return import_string(getattr(settings, 'AUCTIONS_NOTIFICATION_TRANSPORT',
+                                 'auctions.notifications.EmailTransport'))()
+
+
+def record_outbid(listing_id, user_id, amount):
+    # Called in the transaction of the bid that displaced user_id
+    OutbidNotice.objects.create(user_id=user_id, listing_id=listing_id, amount=amount)
+
+
+def _count(name, delta=1):
+    if not delta:
+        return
+    try:
+        cache.incr(STATS_KEYS[name], delta)
+    except ValueError:
+        if not cache.add(STATS_KEYS[name], delta, timeout=None):
+            cache.incr(STATS_KEYS[name], delta)
+
+
+def deliver(batch_size=100, now=None, transport=None):
+    """Send the notices whose window has passed, up to batch_size (user, listing) pairs; returns the pairs handled."""
+    if now is None:
+        now = timezone.now()
+    window = getattr(settings, 'AUCTIONS_OUTBID_WINDOW', 60)
+    groups = list(OutbidNotice.objects.values('user_id', 'listing_id')
+                  .annotate(first=Min('created'), amount=Max('amount'), count=Count('id'), last_id=Max('id'))
+                  .filter(first__lte=now - timedelta(seconds=window)).order_by('first')[:batch_size])
+    if not groups:
+        return 0
+    users = {row[0]: row[1:] for row in User.objects.filter(id__in={group['user_id'] for group in groups})
+             .values_list('id', 'username', 'email')}
+    listings = {row[0]: row[1:] for row in Listing.objects.filter(id__in={group['listing_id'] for group in groups})
+                .values_list('id', 'name', 'active', 'leading_bidder_id')}
+    notices, firsts = [], []
+    for group in groups:
+        name, active, leader_id = listings[group['listing_id']]
+        if active and leader_id != group['user_id']:
+            username, email = users[group['user_id']]
+            notices.append(Notice(group['user_id'], username, email, group['listing_id'], name, group['amount'],
+                                  group['count']))
+            firsts.append(group['first'])
+    (transport or get_transport()).send(notices)
+
+    # Only the rows that were grouped; later ones start the next window
+    last_ids = {(group['user_id'], group['listing_id']): group['last_id'] for group in groups}
+    rows = OutbidNotice.objects.filter(user_id__in={group['user_id'] for group in groups},
+                                       listing_id__in={group['listing_id'] for group in groups},
+                                       id__lte=max(last_ids.values())).values_list('id', 'user_id', 'listing_id')
+    OutbidNotice.objects.filter(id__in=[notice_id for notice_id, user_id, listing_id in rows
+                                        if notice_id <= last_ids.get((user_id, listing_id), 0)]).delete()
+
+    delivered_at = timezone.now()
+    _count(DELIVERED, len(notices))
+    _count(SKIPPED, len(groups) - len(notices))
+    _count(COALESCED, sum(group['count'] - 1 for group in groups))
+    _count(LAG_MS, int(sum((delivered_at - first).total_seconds() for first in firsts) * 1000))
+    return len(groups)
+
+
+def stats():
+    """Queue depth, age of the oldest queued notice, and delivery counters since the last reset."""
+    found = cache.get_many(STATS_KEYS.values())
+    counters = {name: found.get(key, 0) for name, key in STATS_KEYS.items()}
+    oldest = OutbidNotice.objects.aggregate(Min('created'))['created__min']
+    return {
+        'queued': OutbidNotice.objects.count(),
+        'oldest_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+        DELIVERED: counters[DELIVERED],
+        COALESCED: counters[COALESCED],
+        SKIPPED: counters[SKIPPED],
+        # From the first outbid of a pair to its notice going out
+        'average_lag_seconds': round(counters[LAG_MS] / counters[DELIVERED] / 1000, 1) if counters[DELIVERED] else 0,
+    }
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
@@ -0,0 +1,111 @@
+"""
+Whole-page cache for anonymous browsing of the index, category, brand, model and listing pages.
+
+Pages are grouped (the index, one group per category/brand/model, one per listing) and every group has a
+generation counter in the cache (see auctions/cacheversion.py). A stored page remembers the generations it
+was rendered under, so purging a group is a single counter bump and pages of other groups stay cached.
+A page found under an older generation counts as stale and is rendered again.
+
+Bids, comments, closes and listing edits purge only the listing's own page and, when its card changes,
+the index and its category/brand/model pages. Taxonomy changes purge everything, since every list page
+shows the taxonomy badges.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import taxonomy
+from .cacheversion import bump_version, get_versions
+
+HIT = 'hit'
+MISS = 'miss'
+STALE = 'stale'
+
+ALL_PAGES = 'pagecache:gen:all'
+STATS_KEYS = {outcome: f'pagecache:stats:{outcome}' for outcome in (HIT, MISS, STALE)}
+
+
+def page_group(url_name, kwargs):
+    if url_name == 'index':
+        return 'index'
+    if url_name == 'active_listing':
+        return f"listing:{kwargs['listing_id']}"
+    if url_name in taxonomy.KINDS:
+        item = taxonomy.lookup(url_name, kwargs[url_name])
+        return f'{url_name}:{item.id}' if item is not None else None
+    return None
+
+
+def _generation_key(group):
+    return f'pagecache:gen:{group}'
+
+
+def _page_key(group, full_path):
+    return f'pagecache:page:{group}:{hashlib.md5(full_path.encode()).hexdigest()}'
+
+
+def get_page(group, full_path):
+    # One cache round trip for the page and both generations it depends on
+    page_key, generation_key = _page_key(group, full_path), _generation_key(group)
+    found = cache.get_many([page_key, generation_key, ALL_PAGES])
+    if generation_key not in found or ALL_PAGES not in found:
+        found.update(get_versions([generation_key, ALL_PAGES]))
+    generation = (found[generation_key], found[ALL_PAGES])
+    page = found.get(page_key)
+    if page is None:
+        outcome = MISS
+    elif page['generation'] != generation:
+        outcome, page = STALE, None
+    else:
+        outcome = HIT
+    _count(outcome)
+    return outcome, page, generation
+
+
+def store_page(group, full_path, generation, response, timeout=None):
+    if timeout is None:
+        timeout = getattr(settings, 'AUCTIONS_PAGE_CACHE_TIMEOUT', 5 * 60)
+    cache.set(_page_key(group, full_path), {
+        'generation': generation,
+        'content': response.content,
+        'content_type': response['Content-Type'],
+    }, timeout)
+
+
+def purge(*groups):
+    for group in groups:
+        bump_version(_generation_key(group))
+
+
+def purge_all():
+    bump_version(ALL_PAGES)
+
+
+def purge_listing(listing_id, category_id=None, brand_id=None, model_id=None, lists=True):
+    # lists=False when only the detail page changed (comments); otherwise the card on the list pages changed too
+    groups = [f'listing:{listing_id}']
+    if lists:
+        groups.append('index')
+        for kind, item_id in (('category', category_id), ('brand', brand_id), ('model', model_id)):
+            if item_id is not None:
+                groups.append(f'{kind}:{item_id}')
+    # Purging before the commit would let a reader cache the old state again in between
+    transaction.on_commit(lambda: purge(*groups))
+
+
+def _count(outcome):
+    try:
+        cache.incr(STATS_KEYS[outcome])
+    except ValueError:
+        cache.add(STATS_KEYS[outcome], 1, timeout=None)
+
+
+def stats():
+    found = cache.get_many(STATS_KEYS.values())
+    return {outcome: found.get(key, 0) for outcome, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
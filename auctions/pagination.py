@@ -0,0 +1,55 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage:
+
+    def __init__(self, items, cursor, next_cursor):
+        self.items = items
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(listing):
+    # A Listing, or a row of a values() queryset
+    date, listing_id = (listing['date'], listing['id']) if isinstance(listing, dict) else (listing.date, listing.id)
+    raw = f"{date.isoformat()}|{listing_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, listing_id = raw.split('|')
+        return datetime.fromisoformat(date), int(listing_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise Http404("Invalid page.")
+
+
+def keyset_page(queryset, cursor=None, page_size=None):
+    # Newest first, paged on (date, id) instead of OFFSET so every page costs one index range scan
+    # no matter how deep it is, and a "next" link keeps pointing at the same rows when listings are added.
+    if page_size is None:
+        page_size = getattr(settings, 'AUCTIONS_PAGE_SIZE', 24)
+    queryset = queryset.order_by('-date', '-id')
+    if cursor:
+        date, listing_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=listing_id))
+    items = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(items[page_size - 1]) if len(items) > page_size else None
+    return KeysetPage(items[:page_size], cursor, next_cursor)
@@ -0,0 +1,55 @@
+"""
+Proxy bidding: a bidder leaves a hidden maximum and is bid for automatically, one increment over the
+competition, until someone goes past it.
+
+Only the two highest maximums decide a listing, and the second one is always already bid in full: the visible
+price sits at the runner-up's maximum plus one increment (capped at the leader's). So the whole proxy state of
+a listing is its price, leader and the leader's maximum (Listing.proxy_maximum), and every new bid or maximum is
+resolved against them in one step, however many proxies have been outbid. The step yields the visible Bid rows
+it implies, at most two, and nothing else is written: outbid maximums are exhausted and need not be kept.
+
+resolve() is pure so that auctions.bids (one compare-and-set UPDATE) and the in-memory books of auctions.hot
+decide bids the same way.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+
+# bids: visible (user_id, amount) pairs in the order they happened; maximum: the new leader's hidden maximum,
+# None when it is no higher than the price; outbid: who lost the lead (or failed to take it) in this step
+Resolution = namedtuple('Resolution', ['bids', 'price', 'leader_id', 'maximum', 'outbid'])
+
+
+def increment():
+    return getattr(settings, 'AUCTIONS_BID_INCREMENT', 1)
+
+
+def resolve(price, leader_id, maximum, user_id, amount, proxy=False):
+    """
+    The listing state after user_id bids `amount`, or with proxy=True sets it as their maximum. Returns None
+    when it does not beat the price (or, for the leader's own maximum, the maximum they already have).
+    """
+    step = increment()
+    held = maximum if maximum is not None else price
+    if leader_id is not None and user_id == leader_id:
+        if proxy:
+            # Raising one's own maximum moves nothing visible
+            return Resolution([], price, leader_id, amount, None) if amount > held else None
+        if amount <= price:
+            return None
+        return _resolution([(user_id, amount)], user_id, max(held, amount), None)
+    if amount <= price:
+        return None
+    if leader_id is None or amount > held:
+        # The challenger takes the lead; a defending maximum is bid in full first
+        bids = [(leader_id, held)] if leader_id is not None and held > price else []
+        bids.append((user_id, min(amount, max(held, price) + step) if proxy else amount))
+        return _resolution(bids, user_id, amount if proxy else None, leader_id)
+    # The leader's maximum covers the bid; a tie goes to the maximum that was there first
+    bids = [(user_id, amount), (leader_id, min(held, amount + step))] if amount < held else [(leader_id, held)]
+    return _resolution(bids, leader_id, held, user_id)
+
+
+def _resolution(bids, leader_id, maximum, outbid):
+    price = bids[-1][1]
+    return Resolution(bids, price, leader_id, maximum if maximum is not None and maximum > price else None, outbid)
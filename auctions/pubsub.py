@@ -0,0 +1,93 @@
+"""
+Publish/subscribe layer for live listing updates.
+
+The default InProcessBroker fans messages out to the subscribers of the same process, which is enough when the
+site runs as a single ASGI process. With several processes, point AUCTIONS_PUBSUB_BROKER at a class with the
+same publish()/subscribe() interface backed by a shared broker.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+
+    def __init__(self, broker, channel, max_pending):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+
+    def deliver(self, message):
+        # Runs on the subscriber's event loop. A slow client only needs the latest state, so drop the oldest.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+
+    def __init__(self, max_pending=16):
+        self.max_pending = max_pending
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        # Must be called from the event loop that will consume the messages
+        subscription = Subscription(self, channel, self.max_pending)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, message):
+        # Safe to call from any thread, including the sync views
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'AUCTIONS_PUBSUB_BROKER', 'auctions.pubsub.InProcessBroker'))()
+        return _broker
+
+
+def listing_channel(listing_id):
+    return f'listing:{listing_id}'
+
+
+def publish_bid(listing_id, price, bid_count, leader):
+    # Published once the bid is committed, so subscribers never see a price that could still roll back
+    message = {'listing': listing_id, 'price': price, 'bid_count': bid_count, 'leader': leader}
+    transaction.on_commit(lambda: get_broker().publish(listing_channel(listing_id), message))
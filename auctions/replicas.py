@@ -0,0 +1,108 @@
+"""
+Read replicas for browse traffic.
+
+ReplicaRoutingMiddleware marks the GET requests of the views in REPLICA_VIEWS (the index, the category, brand
+and model pages and the listing page), and ReplicaRouter sends their reads to one of the aliases in
+settings.DATABASE_REPLICAS. Everything else reads from the primary ('default'), and every write goes there.
+
+Replicas lag behind, so a user must not read from one right after writing: a request that wrote (a bid, a
+comment, a watchlist change, a close) sets a cookie that keeps the browser on the primary for
+REPLICA_PIN_SECONDS, which should exceed the replication lag. Within one request, reads after a write stay on
+the primary as well. Users and sessions are always read from the primary: a session created at login may not
+have reached a replica yet. Anonymous pages rendered from a replica are kept in auctions.pagecache for only
+REPLICA_PAGE_CACHE_TIMEOUT seconds: the replica may not have seen the write behind the latest purge yet, and
+such a page would otherwise stay cached until the next one.
+
+Locally, the replicas can be SQLite files refreshed from the primary by `manage.py sync_replica`.
+"""
+import random
+import sqlite3
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Views whose GET requests may read from a replica
+REPLICA_VIEWS = {'index', 'category', 'brand', 'model', 'active_listing'}
+PIN_COOKIE = 'auctions_primary'
+PRIMARY_APPS = {'auth', 'sessions', 'contenttypes', 'admin'}
+
+
+class _RequestState:
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar('auctions_replica_state', default=None)
+
+
+def read_replica():
+    """The replica chosen for the current request, None when it reads from the primary."""
+    state = _state.get()
+    return state.replica if state is not None else None
+
+
+def read_alias():
+    """The database reads go to in the current request."""
+    state = _state.get()
+    if state is None or state.replica is None or state.wrote:
+        return 'default'
+    return state.replica
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS or model._meta.label == settings.AUTH_USER_MODEL:
+            return 'default'
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Route the reads of browse views to a replica and pin users who just wrote to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if replicas and request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES \
+                and request.resolver_match.url_name in REPLICA_VIEWS:
+            _state.get().replica = random.choice(replicas)
+        return None
+
+
+def copy_sqlite(source_path, target_path):
+    # The backup API copies a consistent snapshot, also while the primary is being written to
+    source, target = sqlite3.connect(source_path), sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,165 @@
+"""
+Full-text search over listing names and descriptions.
+
+On SQLite the text lives in auctions_listing_fts, an external-content FTS5 table over auctions_listing that
+triggers keep in sync with every INSERT, UPDATE and DELETE, bulk_create and queryset.update() included.
+Matches are ranked with bm25, a name hit weighing more than a description hit. Other databases fall back to
+icontains, which scans the table.
+
+SQLite migrations that alter auctions_listing rebuild the table and drop its triggers; reinstall_triggers()
+puts them back after every migrate. `manage.py rebuild_search_index` also reindexes from scratch.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+
+from .models import Listing
+
+FTS_TABLE = 'auctions_listing_fts'
+# bm25 weights of the name and description columns
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, content='auctions_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    # Bids update the row all the time; only a change to the indexed text touches the index
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, description ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+UNINSTALL_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts_available(conn=connection):
+    return conn.vendor == 'sqlite'
+
+
+def install(conn=connection, rebuild=False):
+    with conn.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+        if rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def reinstall_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    # post_migrate receiver; only once migration 0048 has created the table
+    conn = connections[using]
+    if fts_available(conn) and FTS_TABLE in conn.introspection.table_names():
+        install(conn)
+
+
+def uninstall(conn=connection):
+    with conn.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+def normalize(query):
+    # Words only, lowercased and de-duplicated, so "Red  BIKE!" and "red bike" share a cache entry
+    # and nothing the user types is interpreted as FTS5 syntax
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(dict.fromkeys(words))
+
+
+def match_expression(normalized):
+    # Every word must match, the last one as a prefix so results show up while typing
+    words = normalized.split()
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return ' '.join(terms)
+
+
+class QueryCache:
+    """A small thread-safe LRU of search result ids with a time to live."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+query_cache = QueryCache(getattr(settings, 'AUCTIONS_SEARCH_CACHE_SIZE', 256),
+                         getattr(settings, 'AUCTIONS_SEARCH_CACHE_TTL', 30))
+
+
+def search_ids(normalized, filters, limit, offset):
+    """Ids of active listings matching a normalized query, best match first."""
+    if fts_available():
+        conditions, params = [], [match_expression(normalized)]
+        for column, value in filters.items():
+            conditions.append(f'AND l.{column} = %s')
+            params.append(value)
+        sql = f"""
+            SELECT l.id FROM {FTS_TABLE} JOIN auctions_listing l ON l.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND l.active {' '.join(conditions)}
+            ORDER BY bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}), l.id DESC
+            LIMIT %s OFFSET %s"""
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+    queryset = Listing.objects.filter(active=True, **filters)
+    for word in normalized.split():
+        queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+    return list(queryset.order_by('-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+def search(query, filters=None, page=1, page_size=None):
+    """
+    Return (ids, has_next) for one page of results. filters maps listing columns (category_id, brand_id,
+    model_id) to values. Results are cached for AUCTIONS_SEARCH_CACHE_TTL seconds.
+    """
+    if page_size is None:
+        page_size = getattr(settings, 'AUCTIONS_PAGE_SIZE', 24)
+    normalized = normalize(query)
+    if not normalized:
+        return [], False
+    filters = filters or {}
+    key = (normalized, tuple(sorted(filters.items())), page, page_size)
+    ids = query_cache.get(key)
+    if ids is None:
+        ids = search_ids(normalized, filters, page_size + 1, (page - 1) * page_size)
+        query_cache.set(key, ids)
+    return ids[:page_size], len(ids) > page_size
@@ -0,0 +1,143 @@
+"""
+Settling closed listings, and the outbox of work that follows.
+
+settle() is the whole of a close: one transaction that marks the listings inactive, writes their winner (the
+leading bidder kept on the row by auctions.bids) and final price, and appends three OutboxEvent rows per
+listing. Its cost does not depend on how many bids or bidders a listing has. Everything that does, mailing
+every losing bidder in particular, is left to `manage.py process_outbox`, which drains the events in batches.
+
+An event is only ever written together with the close it follows, so a notice is never lost when the worker
+is down and never sent for a close that rolled back. Delivery is at least once: a worker dying mid-batch
+leaves its events to be picked up again once their lease runs out.
+"""
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from . import facets, pagecache
+from .bids import release_hot_listing
+from .models import Bid, Listing, OutboxEvent
+
+# Losing bidders mailed per batch of a loser_notices event
+LOSER_BATCH_SIZE = 500
+# How long a claimed event stays hidden from other workers
+LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = 3600
+
+
+def settle(listings):
+    """Close and settle the active listings among a Listing queryset; returns how many were closed."""
+    rows = list(listings.filter(active=True).values_list('id', 'hot', 'category_id', 'brand_id', 'model_id'))
+    for listing_id, hot, *taxonomy_ids in rows:
+        if hot:
+            # The in-memory engine holds bids the row does not have yet
+            release_hot_listing(Listing(id=listing_id, hot=True))
+    if not rows:
+        return 0
+    ids = [row[0] for row in rows]
+    with transaction.atomic():
+        closed = Listing.objects.filter(id__in=ids, active=True).update(
+            active=False, winner=F('leading_bidder'), version=F('version') + 1,
+            final_price=Case(When(leading_bidder__isnull=False, then=F('current_price'))))
+        # A listing another close got to first already has its events; the unique constraint skips them
+        OutboxEvent.objects.bulk_create([OutboxEvent(listing_id=listing_id, kind=kind)
+                                         for listing_id in ids for kind, label in OutboxEvent.KINDS],
+                                        ignore_conflicts=True)
+    for listing_id, hot, *taxonomy_ids in rows:
+        pagecache.purge_listing(listing_id, *taxonomy_ids)
+    transaction.on_commit(facets.invalidate)
+    return closed
+
+
+def winner_notice(event, connection):
+    listing = event.listing
+    if listing.winner is not None and listing.winner.email:
+        connection.send_messages([EmailMessage(
+            f"You won {listing.name}",
+            f"Congratulations, your bid of {listing.final_price} € won {listing.name}.",
+            to=[listing.winner.email])])
+    return True
+
+
+def loser_notices(event, connection):
+    # One batch of the losing bidders per call, in user id order from where the last batch stopped
+    listing = event.listing
+    bidders = list(Bid.objects.filter(item_bid_id=listing.id, user_bid_id__gt=event.progress)
+                   .exclude(user_bid_id=listing.winner_id).order_by('user_bid_id')
+                   .values_list('user_bid_id', 'user_bid__email').distinct()[:LOSER_BATCH_SIZE])
+    messages = [EmailMessage(f"{listing.name} has ended",
+                             f"The auction for {listing.name} ended at {listing.final_price} €. "
+                             f"Your bid did not win this time.", to=[email])
+                for user_id, email in bidders if email]
+    if messages:
+        connection.send_messages(messages)
+    if bidders:
+        event.progress = bidders[-1][0]
+    return len(bidders) < LOSER_BATCH_SIZE
+
+
+def owner_summary(event, connection):
+    listing = event.listing
+    if not listing.owner.email:
+        return True
+    if listing.winner is not None:
+        body = f"{listing.name} sold to {listing.winner} for {listing.final_price} € " \
+               f"after {listing.bid_count} bid(s)."
+    else:
+        body = f"{listing.name} closed without bids."
+    connection.send_messages([EmailMessage(f"{listing.name} has ended", body, to=[listing.owner.email])])
+    return True
+
+
+HANDLERS = {
+    OutboxEvent.WINNER_NOTICE: winner_notice,
+    OutboxEvent.LOSER_NOTICES: loser_notices,
+    OutboxEvent.OWNER_SUMMARY: owner_summary,
+}
+
+
+def claim(batch_size, now):
+    # Lease the oldest due events; skip_locked lets several workers share the outbox on databases with row locks
+    with transaction.atomic():
+        ids = list(OutboxEvent.objects.select_for_update(skip_locked=True)
+                   .filter(processed_at__isnull=True, available_at__lte=now).order_by('available_at', 'id')
+                   .values_list('id', flat=True)[:batch_size])
+        OutboxEvent.objects.filter(id__in=ids).update(available_at=now + LEASE)
+    return list(OutboxEvent.objects.filter(id__in=ids).select_related('listing__owner', 'listing__winner')
+                .order_by('id'))
+
+
+def process_outbox(batch_size=100):
+    """Handle one batch of due outbox events; returns (handled, failed)."""
+    now = timezone.now()
+    events = claim(batch_size, now)
+    if not events:
+        return 0, 0
+    done, failed = [], 0
+    with get_connection() as connection:
+        for event in events:
+            try:
+                finished = HANDLERS[event.kind](event, connection)
+            except Exception as e:
+                failed += 1
+                event.attempts += 1
+                event.last_error = repr(e)
+                # Exponential backoff, so a broken mail server is not hammered
+                event.available_at = timezone.now() + timedelta(seconds=min(2 ** event.attempts, MAX_RETRY_DELAY))
+                event.save(update_fields=['attempts', 'last_error', 'available_at'])
+                continue
+            if finished:
+                done.append(event.id)
+            else:
+                # More batches to go; due again right away
+                event.available_at = now
+                event.save(update_fields=['progress', 'available_at'])
+    OutboxEvent.objects.filter(id__in=done).update(processed_at=timezone.now())
+    return len(events) - failed, failed
+
+
+def pending():
+    return OutboxEvent.objects.filter(processed_at__isnull=True).count()
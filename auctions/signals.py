@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import facets, pagecache, taxonomy
+from .models import Listing, Comment, Category, Brand, Model
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Model)
+def invalidate_taxonomy(sender, **kwargs):
+    # After the commit, or a concurrent reader could cache the old rows again for a whole day
+    transaction.on_commit(taxonomy.invalidate)
+    transaction.on_commit(pagecache.purge_all)
+
+
+def taxonomy_ids(instance):
+    # Deferred fields are not in __dict__ and come back as None: unknown, nothing to purge for them
+    return tuple(instance.__dict__.get(attname) for attname in ('category_id', 'brand_id', 'model_id'))
+
+
+@receiver(post_init, sender=Listing)
+def remember_listing_taxonomy(sender, instance, **kwargs):
+    instance._loaded_taxonomy = taxonomy_ids(instance)
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def purge_listing_pages(sender, instance, **kwargs):
+    current = taxonomy_ids(instance)
+    pagecache.purge_listing(instance.id, *current)
+    # A listing moved to another category, brand or model also leaves the pages of the old one
+    moved = [old if old != new else None for old, new in zip(instance._loaded_taxonomy, current)]
+    if any(item_id is not None for item_id in moved):
+        pagecache.purge_listing(instance.id, *moved)
+    instance._loaded_taxonomy = current
+    transaction.on_commit(facets.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    if instance.listing_comment_id is not None:
+        # Comments are part of the listing detail, so they move its version (and the API's ETag) too
+        Listing.objects.filter(id=instance.listing_comment_id).update(version=F('version') + 1)
+        pagecache.purge_listing(instance.listing_comment_id, lists=False)
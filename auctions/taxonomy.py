@@ -0,0 +1,51 @@
+"""
+Category, Brand and Model rows cached as a whole in the Django cache.
+
+The cached entry is keyed by a version number kept in the cache too. Saving or deleting any taxonomy row
+bumps the version (see auctions/signals.py), so every process sharing the cache backend moves on to a fresh
+entry with its next read and stale ones simply expire. Code that writes taxonomy rows without signals
+(bulk_create, queryset.update) must call invalidate() itself.
+"""
+from django.core.cache import cache
+
+from .cacheversion import bump_version, get_version
+from .models import Category, Brand, Model
+
+VERSION_KEY = 'taxonomy:version'
+TAXONOMY_TIMEOUT = 24 * 60 * 60
+
+# kind -> (model, name field)
+KINDS = {
+    'category': (Category, 'category'),
+    'brand': (Brand, 'brand'),
+    'model': (Model, 'model'),
+}
+
+
+def version():
+    return get_version(VERSION_KEY)
+
+
+def invalidate():
+    bump_version(VERSION_KEY)
+
+
+def get_taxonomy():
+    # {'category': {'items': [...], 'by_name': {name: obj}}, 'brand': ..., 'model': ...}
+    key = f'taxonomy:{version()}'
+    taxonomy = cache.get(key)
+    if taxonomy is None:
+        taxonomy = {}
+        for kind, (model, field) in KINDS.items():
+            items = list(model.objects.order_by('id'))
+            taxonomy[kind] = {'items': items, 'by_name': {getattr(item, field): item for item in items}}
+        cache.set(key, taxonomy, TAXONOMY_TIMEOUT)
+    return taxonomy
+
+
+def all_items(kind):
+    return get_taxonomy()[kind]['items']
+
+
+def lookup(kind, name):
+    return get_taxonomy()[kind]['by_name'].get(name)
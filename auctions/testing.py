@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.urls import reverse
+
+from .budgets import QUERY_BUDGETS
+from .models import User, Listing
+
+
+def bike_listing(**fields):
+    """Create the owner and bidder users and the owner's 'Bike' listing most tests start from."""
+    owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+    bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+    listing = Listing.objects.create(name='Bike', starting_bid=10, description='Red bike', url='', owner=owner,
+                                     **fields)
+    return owner, bidder, listing
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin asserting the query budgets of auctions/budgets.py, using the counts
+    auctions.middleware.QueryBudgetMiddleware reports in the X-Query-Count header.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        url_name = response.resolver_match.url_name
+        if budget is None:
+            budget = getattr(settings, 'QUERY_BUDGETS', QUERY_BUDGETS)[url_name]
+        count = int(response['X-Query-Count'])
+        self.assertLessEqual(count, budget, f"{url_name} ran {count} queries "
+                                            f"({response['X-Query-Duplicates']} duplicates), budget is {budget}")
+        return count
+
+    def request_within_budget(self, url_name, args=(), method='get', data=None, budget=None):
+        response = getattr(self.client, method)(reverse(url_name, args=args), data)
+        self.assertLess(response.status_code, 400, f"{method.upper()} {url_name} returned {response.status_code}")
+        self.assertWithinQueryBudget(response, budget)
+        return response
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -16,5 +16,12 @@ urlpatterns = [
     path("purchase_history", views.purchase_history, name="purchase_history"),
     path("close_bid", views.close_bid, name="close_bid"),
     path('comment', views.comment, name='comment'),
+    path('browse', views.browse, name='browse'),
+    path('search', views.search_listings, name='search'),
+    path('export/<str:kind>.<str:fmt>', views.export, name='export'),
+    path('api/v1/listings', api.listings, name='api_listings'),
+    path('api/v1/listings/<int:listing_id>', api.listing, name='api_listing'),
+    path('api/v1/listings/<int:listing_id>/bids', api.bid, name='api_bid'),
+    path('api/v1/taxonomy', api.taxonomy_items, name='api_taxonomy'),
 
     ]
@@ -1,18 +1,38 @@
+from datetime import timedelta
+
 from django.contrib.auth import authenticate, login, logout
 from django.db import IntegrityError
-from django.http import HttpResponseBadRequest, HttpResponseRedirect, Http404
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
 from django import forms
-from django.db.models import Max
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+
+from . import exports, facets, search, taxonomy
+from .bids import ACCEPTED, apply_live_state, bid_message, submit_bid
+from .models import User, Listing, Watchlist, Comment
+from .pagination import keyset_page
+from .settlement import settle
+
+
+# Columns the listing cards render (or key their cache entry on), loaded together with their taxonomy in one query
+CARD_FIELDS = ('id', 'name', 'url', 'description', 'starting_bid', 'current_price', 'bid_count', 'date', 'version',
+               'category__category', 'brand__brand', 'model__model')
 
-from .models import User, Listing, Watchlist, Bid, Comment, Category, Brand, Model
+# Auction lengths offered when creating a listing, in days
+DURATIONS = ('1', '3', '7', '14')
+
+
+def listing_cards(queryset):
+    return queryset.select_related('category', 'brand', 'model').only(*CARD_FIELDS)
 
 
 class BidForm(forms.Form):
     bid_form = forms.IntegerField(required=True, label='Create your bid')
     bid_form.widget.attrs.update({'class': 'form-control'})
+    proxy = forms.BooleanField(required=False, label='Bid automatically up to this amount')
 
 
 class CommentForm(forms.Form):
@@ -24,11 +44,11 @@ class CommentForm(forms.Form):
 
 
 def index(request):
-    all_listings = Listing.objects.all()
-    # Get unique values from category query
-    all_categories = Category.objects.all()
-    all_brands = Brand.objects.all()
-    all_models = Model.objects.all()
+    all_listings = keyset_page(listing_cards(Listing.objects.filter(active=True)), request.GET.get('after'))
+    # Taxonomy comes from the cache, see auctions/taxonomy.py
+    all_categories = taxonomy.all_items('category')
+    all_brands = taxonomy.all_items('brand')
+    all_models = taxonomy.all_items('model')
     return render(request, "auctions/index.html", {
         "all_categories": all_categories,
         "listings": all_listings,
@@ -91,13 +111,14 @@ def register(request):
 @login_required
 def create_listing(request):
     if request.method == "GET":
-        all_categories = Category.objects.all()
-        all_brands = Brand.objects.all()
-        all_models = Model.objects.all()
+        all_categories = taxonomy.all_items('category')
+        all_brands = taxonomy.all_items('brand')
+        all_models = taxonomy.all_items('model')
         return render(request, "auctions/create_listing.html", {
             "all_categories": all_categories,
             "all_brands": all_brands,
             "all_models": all_models,
+            "durations": DURATIONS,
         })
     if request.method == "POST":
         name = request.POST["name"]
@@ -107,11 +128,14 @@ def create_listing(request):
         starting_bid = request.POST["starting_bid"]
         description = request.POST["description"]
         url = request.POST["url"]
-        owner = request.POST['owner']
-        user_owner = User.objects.get(username=owner)
+        duration = request.POST.get("duration")
+        if duration and duration not in DURATIONS:
+            return HttpResponseBadRequest("Invalid duration.")
+        end_time = timezone.now() + timedelta(days=int(duration)) if duration else None
         try:
             listings_created = Listing(name=name, category_id=categoryId, brand_id=brandId, model_id=modelId,
-                                       starting_bid=starting_bid, description=description, url=url, owner=user_owner)
+                                       starting_bid=starting_bid, description=description, url=url, owner=request.user,
+                                       end_time=end_time)
 
             listings_created.save()
             return HttpResponseRedirect(reverse("index"))
@@ -126,11 +150,7 @@ def create_listing(request):
 @login_required
 def purchase_history(request):
     if request.method == "GET":
-        listings = []
-        if len(Listing.objects.get(winner_id=request.user.id)) is 0:
-            listings = Listing.objects.none()
-        else:
-            listings = Listing.objects.get(winner_id=request.user.id)
+        listings = listing_cards(Listing.objects.filter(winner_id=request.user.id))
         return render(request, "auctions/purchase_history.html", {
             "listings": listings
         })
@@ -138,79 +158,47 @@ def purchase_history(request):
 
 def active_listing(request, listing_id):
     try:
-        listing = Listing.objects.get(id=listing_id)
-        current_user = request.user.id
-        bid_count = Bid.objects.filter(item_bid=listing_id).count()
-        if bid_count > 0:
-            max_bid = Bid.objects.filter(item_bid=listing_id).aggregate(Max('bid'))
-            max_bid = max_bid['bid__max']
-        else:
-            max_bid = listing.starting_bid
-        if Watchlist.objects.filter(user_watchlist=current_user, listing_item=listing_id).exists():
-            watchlist_state = False
-        else:
-            watchlist_state = True
+        listing = apply_live_state(Listing.objects.select_related('category', 'owner', 'winner').get(id=listing_id))
+        # Anonymous users never see the watchlist button
+        watchlist_state = request.user.is_authenticated and not Watchlist.objects.filter(
+            user_watchlist=request.user.id, listing_item=listing_id).exists()
     except Listing.DoesNotExist:
         raise Http404("Listing not found.")
     # All comments
     # Get comments for this listing item
-    comments = Comment.objects.filter(listing_comment=listing_id)
+    comments = Comment.objects.filter(listing_comment=listing_id).select_related('user_comment').only(
+        'comment', 'user_comment__username')
     # Make a Bid block
     if request.method == 'POST':
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse('login'))
         form = BidForm(request.POST)
-        current_user = request.user.id
-        listing_id = request.POST["listing_id"]
-        listing_item = Listing.objects.get(id=listing_id)
-        user_bid = User.objects.get(id=current_user)
-        if form.is_valid():
-            current_bid = form.cleaned_data['bid_form']
-            bid_count = Bid.objects.filter(item_bid=listing_id).count()
-            if bid_count > 0:
-                max_bid = Bid.objects.filter(item_bid=listing_id).aggregate(Max('bid'))
-                max_bid = max_bid['bid__max']
-            else:
-                max_bid = listing_item.starting_bid
-            if current_user is listing_item.owner.id:
-                return render(request, "auctions/active_listing.html", {
-                    "listing": listing_item,
-                    'comments': comments,
-                    'max_bid': max_bid,
-                    'bid_count': bid_count,
-                    'form': BidForm(),
-                    'comment_form': CommentForm(),
-                    "err_message": "You cannot bid on your own listing."
-                })
-            if current_bid > max_bid:
-                bid = Bid(user_bid=user_bid, item_bid_id=listing_item.id, bid=current_bid)
-                bid.save()
-                return render(request, "auctions/active_listing.html", {
-                    "listing": listing_item,
-                    'comments': comments,
-                    'max_bid': current_bid,
-                    'bid_count': bid_count + 1,
-                    'form': BidForm(),
-                    'comment_form': CommentForm(),
-                    "succ_message": f"You made a successful bid for {current_bid} € !"
-                })
-            else:
-                return render(request, "auctions/active_listing.html", {
-                    "listing": listing_item,
-                    'comments': comments,
-                    'max_bid': max_bid,
-                    'bid_count': bid_count,
-                    'form': BidForm(),
-                    'comment_form': CommentForm(),
-                    "err_message": "Bid can't be less than current max bid"
-                })
-        else:
+        if not form.is_valid():
             return HttpResponseBadRequest("Form is not valid")
+        proxy = form.cleaned_data['proxy']
+        result = submit_bid(listing, request.user, form.cleaned_data['bid_form'], proxy)
+        message_key = "succ_message" if result.status == ACCEPTED else "err_message"
+        return render(request, "auctions/active_listing.html", {
+            "listing": listing,
+            'comments': comments,
+            'watchlist_state': watchlist_state,
+            'max_bid': result.price,
+            'bid_count': result.bid_count,
+            'my_maximum': result.amount if proxy and result.status == ACCEPTED and result.amount > result.price
+            else None,
+            'form': BidForm(),
+            'comment_form': CommentForm(),
+            message_key: bid_message(result, proxy)
+        })
     # End bid block
     return render(request, "auctions/active_listing.html", {
         "listing": listing,
         'comments': comments,
         'watchlist_state': watchlist_state,
-        'bid_count': bid_count,
-        'max_bid': max_bid,
+        'bid_count': listing.bid_count,
+        'max_bid': listing.current_price,
+        # The hidden maximum is only ever shown to its owner
+        'my_maximum': listing.proxy_maximum if listing.leading_bidder_id == request.user.id else None,
         'form': BidForm(),
         'comment_form': CommentForm()
     })
@@ -221,21 +209,18 @@ def watchlist(request):
     current_user = request.user.id
     if request.method == "POST":
         listing_id = request.POST["listing_id"]
-        # Get User id and Listing id through their models
-        watching_user = User.objects.get(id=current_user)
-        listing_item = Listing.objects.get(id=listing_id)
-        # Create watchlist
-        watchlist = Watchlist(user_watchlist=watching_user, listing_item=listing_item)
-        # Check if user already have that item in watchlist
-        current_item = Watchlist.objects.filter(user_watchlist=current_user, listing_item=listing_item)
-        if current_item.exists():
-            current_item.delete()
-        else:
-            watchlist.save()
-    current_watch_id = Watchlist.objects.filter(user_watchlist=current_user)
-    current_watchlist = current_watch_id.all()
+        # Remove the item if the user already has it in the watchlist, add it otherwise
+        deleted, _ = Watchlist.objects.filter(user_watchlist=current_user, listing_item=listing_id).delete()
+        if not deleted:
+            try:
+                Watchlist.objects.create(user_watchlist=request.user, listing_item_id=listing_id)
+            except IntegrityError:
+                raise Http404("Listing not found.")
+    # Listings in the order they were added to the watchlist
+    listings = listing_cards(Listing.objects.filter(listing_item__user_watchlist=current_user)) \
+        .order_by('listing_item__id')
     return render(request, "auctions/watchlist.html", {
-        "all_watchlists": current_watchlist
+        "listings": listings
     })
 
 
@@ -243,31 +228,19 @@ def watchlist(request):
 def close_bid(request):
     if request.method == "POST":
         listing_id = request.POST["listing_id"]
-        active_listing = Listing.objects.get(id=listing_id)
-        active_listing.active = False
-        bid_count = Bid.objects.filter(item_bid=listing_id).count()
-        if bid_count > 0:
-            max_bid = Bid.objects.filter(item_bid=listing_id).aggregate(Max('bid'))
-            max_bid = max_bid['bid__max']
-            bid_winner = Bid.objects.get(item_bid=listing_id, bid=max_bid)
-            active_listing.winner = bid_winner.user_bid
-        else:
-            active_listing.winner = None
-        active_listing.save()
+        # Only the owner may close. Settlement is constant work; notices go through the outbox
+        settle(Listing.objects.filter(id=listing_id, owner=request.user))
         return HttpResponseRedirect(reverse('index'))
 
 
 @login_required
 def comment(request):
-    current_user = request.user.id
-    current_user = User.objects.get(id=current_user)
     comment_form = CommentForm(request.POST)
     if request.method == "POST":
         listing_id = request.POST["listing_id"]
-        listing_item = Listing.objects.get(id=listing_id)
         if comment_form.is_valid():
             current_comment = comment_form.cleaned_data['comment']
-            create_comment = Comment(user_comment=current_user, listing_comment=listing_item, comment=current_comment)
+            create_comment = Comment(user_comment=request.user, listing_comment_id=listing_id, comment=current_comment)
             create_comment.save()
             return HttpResponseRedirect(reverse('active_listing', args=(listing_id,)))
         else:
@@ -275,8 +248,11 @@ def comment(request):
 
 
 def category(request, category):
-    category = Category.objects.get(category=category)
-    listing_category = Listing.objects.filter(category_id=category.id)
+    category = taxonomy.lookup('category', category)
+    if category is None:
+        raise Http404("Category not found.")
+    listing_category = keyset_page(listing_cards(Listing.objects.filter(category_id=category.id, active=True)),
+                                   request.GET.get('after'))
     return render(request, "auctions/category.html", {
         'category': category,
         'listing_category': listing_category
@@ -284,8 +260,11 @@ def category(request, category):
 
 
 def brand(request, brand):
-    brand = Brand.objects.get(brand=brand)
-    listing_brand = Listing.objects.filter(brand_id=brand.id)
+    brand = taxonomy.lookup('brand', brand)
+    if brand is None:
+        raise Http404("Brand not found.")
+    listing_brand = keyset_page(listing_cards(Listing.objects.filter(brand_id=brand.id, active=True)),
+                                request.GET.get('after'))
     return render(request, "auctions/brand.html", {
         'brand': brand,
         'listing_brand': listing_brand
@@ -293,9 +272,67 @@ def brand(request, brand):
 
 
 def model(request, model):
-    model = Model.objects.get(model=model)
-    listing_model = Listing.objects.filter(model_id=model.id)
+    model = taxonomy.lookup('model', model)
+    if model is None:
+        raise Http404("Model not found.")
+    listing_model = keyset_page(listing_cards(Listing.objects.filter(model_id=model.id, active=True)),
+                                request.GET.get('after'))
     return render(request, "auctions/model.html", {
         'model': model,
         'listing_model': listing_model
     })
+
+
+def browse(request):
+    filters = facets.parse_filters(request.GET)
+    listings = keyset_page(listing_cards(Listing.objects.filter(facets.filter_q(filters))), request.GET.get('after'))
+    return render(request, "auctions/browse.html", {
+        'listings': listings,
+        'facets': facets.facet_groups(filters, facets.facet_counts(filters)),
+        'filters': filters,
+        'page_query': facets.filter_query(filters),
+    })
+
+
+def search_listings(request):
+    query = request.GET.get('q', '').strip()
+    filters, names = {}, {}
+    for kind in taxonomy.KINDS:
+        name = request.GET.get(kind)
+        if name:
+            item = taxonomy.lookup(kind, name)
+            if item is None:
+                raise Http404(f"{kind.capitalize()} not found.")
+            filters[f'{kind}_id'], names[kind] = item.id, name
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        raise Http404("Invalid page.")
+    ids, has_next = search.search(query, filters, page)
+    # Cards are read fresh, so prices are current even when the ids come from the search cache
+    found = listing_cards(Listing.objects.filter(id__in=ids, active=True)).in_bulk(ids) if ids else {}
+    return render(request, "auctions/search.html", {
+        'query': query,
+        'filters': names,
+        'listings': [found[listing_id] for listing_id in ids if listing_id in found],
+        'page': page,
+        'has_next': has_next,
+        'page_query': urlencode({'q': query, **names}),
+        'all_categories': taxonomy.all_items('category'),
+        'all_brands': taxonomy.all_items('brand'),
+        'all_models': taxonomy.all_items('model'),
+    })
+
+
+@user_passes_test(lambda user: user.is_staff)
+def export(request, kind, fmt):
+    if kind not in exports.EXPORTS or fmt not in exports.FORMATS:
+        raise Http404("Unknown export.")
+    try:
+        rows = exports.export_queryset(kind, **{key: request.GET.get(key) for key in
+                                                ('since', 'until', 'category', 'active', 'after')})
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(exports.stream_rows(rows, fmt), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
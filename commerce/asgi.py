@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; serves the live bid updates of /<listing_id>/events next to the site
+from auctions.live import with_listing_events  # noqa: E402
+
+application = with_listing_events(django_application)